@@ -1,53 +1,201 @@
 # habit_free/app.py
 
 import os
-from flask import Flask, request, jsonify, session
+import click
+from flask import (Blueprint, Flask, Response, current_app, has_request_context, request, jsonify, session, g,
+                   stream_with_context)
+from flask.cli import with_appcontext
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import delete, event, insert, inspect, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timezone, timedelta
+import atexit
+import base64
+import bisect
+import copy
+import gzip
 import hashlib
+import json
+import queue
+import hmac
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from apscheduler.schedulers.background import BackgroundScheduler
 import pytz
 from dotenv import load_dotenv
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask.logging import default_handler
+try:
+    import fcntl
+except ImportError:  # Windows: no file-lock leader election, see FileLeaderLock
+    fcntl = None
+try:
+    import orjson
+except ImportError:  # optional: OrjsonProvider falls back to the stdlib encoder
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
-app.secret_key = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
-
-# Configure logging
-if not os.path.exists('logs'):
-    os.mkdir('logs')
-file_handler = RotatingFileHandler('logs/habit_free.log', maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('Habit Free startup')
-
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.start()
-
-# Determine base directory and set up SQLite database URI
+# Extensions and routes are bound to an app in create_app()
+db = SQLAlchemy()
+api = Blueprint('api', __name__)
+
+# Determine base directory and set up the database URI; SQLite next to the
+# source by default, or any SQLAlchemy URL (e.g. PostgreSQL) from DATABASE_URL
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'habits.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+
+def database_uri():
+    uri = os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'habits.db')
+    # some hosts still hand out the pre-SQLAlchemy-1.4 scheme
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def engine_options(uri):
+    """Connection pool settings from the environment.
+
+    pre-ping and recycle apply to every backend; pool size, overflow and
+    timeout only to server databases, where connections are a shared resource.
+    """
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    if not uri.startswith('sqlite'):
+        options.update(
+            pool_size=int(os.getenv('DB_POOL_SIZE', 5)),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+def sqlite_pragmas():
+    """PRAGMAs run on every new SQLite connection; none when SQLITE_TUNING is off.
+
+    WAL lets readers proceed while a writer commits, synchronous=NORMAL is
+    durable under WAL except on power loss, and busy_timeout makes a blocked
+    writer wait instead of failing with "database is locked".
+    """
+    if os.getenv('SQLITE_TUNING', 'true').lower() != 'true':
+        return []
+    return [
+        f"journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))}",  # negative means KiB
+        f"mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))}",
+    ]
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run `pragmas` on each new DBAPI connection the engine opens."""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+        cursor.close()
+
+def load_config(app):
+    """Read the app configuration from the environment."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas()
+    # number of rows rewritten per transaction by the send_date migration
+    app.config['MIGRATION_BATCH_SIZE'] = int(os.getenv('MIGRATION_BATCH_SIZE', 1000))
+    # number of messages delivered (and deleted) per transaction by the scheduler,
+    # and of tombstones removed per transaction by the purge
+    app.config['DELIVERY_CHUNK_SIZE'] = int(os.getenv('DELIVERY_CHUNK_SIZE', 500))
+    # password hashing: 'scrypt' or 'pbkdf2_sha256', plus the cost of each
+    app.config['PASSWORD_HASHER'] = os.getenv('PASSWORD_HASHER', 'scrypt')
+    app.config['SCRYPT_N'] = int(os.getenv('SCRYPT_N', 2 ** 14))
+    app.config['SCRYPT_R'] = int(os.getenv('SCRYPT_R', 8))
+    app.config['SCRYPT_P'] = int(os.getenv('SCRYPT_P', 1))
+    app.config['PBKDF2_ITERATIONS'] = int(os.getenv('PBKDF2_ITERATIONS', 600000))
+    # threads doing KDF work, and the cache of recent successful verifications
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    app.config['PASSWORD_CACHE_SIZE'] = int(os.getenv('PASSWORD_CACHE_SIZE', 1024))
+    app.config['PASSWORD_CACHE_TTL'] = int(os.getenv('PASSWORD_CACHE_TTL', 300))
+    # session tokens: lifetime in seconds, size of the in-process validation cache,
+    # and whether requests without a token may still identify by a user_id parameter
+    # (an unauthenticated impersonation hole; only for migrating pre-token clients)
+    app.config['SESSION_TOKEN_TTL'] = int(os.getenv('SESSION_TOKEN_TTL', 30 * 24 * 3600))
+    app.config['SESSION_CACHE_SIZE'] = int(os.getenv('SESSION_CACHE_SIZE', 10000))
+    app.config['AUTH_ALLOW_USER_ID_PARAM'] = os.getenv('AUTH_ALLOW_USER_ID_PARAM', 'false').lower() == 'true'
+    # page sizes for the keyset-paginated list endpoints
+    app.config['PAGE_SIZE_DEFAULT'] = int(os.getenv('PAGE_SIZE_DEFAULT', 50))
+    app.config['PAGE_SIZE_MAX'] = int(os.getenv('PAGE_SIZE_MAX', 200))
+    # largest number of operations accepted by one /batch request
+    app.config['BATCH_MAX_OPERATIONS'] = int(os.getenv('BATCH_MAX_OPERATIONS', 100))
+    # days a /batch op_id is remembered, so a replayed operation isn't applied twice
+    app.config['BATCH_OP_ID_DAYS'] = int(os.getenv('BATCH_OP_ID_DAYS', 30))
+    # /sync: days deleted rows are kept as tombstones (a token older than that gets a
+    # full reset), and seconds re-read before each token to catch late commits
+    app.config['SYNC_TOMBSTONE_DAYS'] = int(os.getenv('SYNC_TOMBSTONE_DAYS', 30))
+    app.config['SYNC_OVERLAP_SECONDS'] = int(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+    # rows per table in each page of a full /sync reset
+    app.config['SYNC_PAGE_SIZE'] = int(os.getenv('SYNC_PAGE_SIZE', 500))
+    # scheduler: whether this process takes part, how often it retries the leader
+    # election, and the lock it competes for (a file on SQLite, an advisory lock on PostgreSQL)
+    app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    app.config['SCHEDULER_ELECTION_INTERVAL'] = int(os.getenv('SCHEDULER_ELECTION_INTERVAL', 30))
+    app.config['SCHEDULER_LOCK_FILE'] = os.getenv('SCHEDULER_LOCK_FILE', os.path.join(basedir, 'scheduler.lock'))
+    app.config['SCHEDULER_LOCK_KEY'] = int(os.getenv('SCHEDULER_LOCK_KEY', 0x48414249))  # 'HABI'
+    # /metrics: on by default; when METRICS_TOKEN is set, scrapers must send it as a Bearer token
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+    # /export fetches rows from the database this many at a time; /import commits
+    # every IMPORT_BATCH_SIZE rows and rejects lines longer than IMPORT_MAX_LINE bytes
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+    app.config['IMPORT_MAX_LINE'] = int(os.getenv('IMPORT_MAX_LINE', 64 * 1024))
+    # dev/staging SQL profiler: per-request statement log with N+1 detection,
+    # reported in the X-SQL-Profile header and at /sql_profile; off in production
+    app.config['SQL_PROFILER'] = os.getenv('SQL_PROFILER', 'false').lower() == 'true'
+    app.config['SQL_PROFILER_N_PLUS_ONE'] = int(os.getenv('SQL_PROFILER_N_PLUS_ONE', 3))
+    app.config['SQL_PROFILER_HISTORY'] = int(os.getenv('SQL_PROFILER_HISTORY', 100))
+    # reports hold other users' query parameters: /sql_profile requires this Bearer
+    # token when set, and otherwise only answers requests from the local machine
+    app.config['SQL_PROFILER_TOKEN'] = os.getenv('SQL_PROFILER_TOKEN')
+    # JSON encoder for responses: 'auto' (orjson when installed), 'orjson' or 'stdlib'
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'auto')
+    # response compression, negotiated per request through Accept-Encoding; bodies
+    # under COMPRESSION_MIN_SIZE bytes are sent as-is. Levels are capped: brotli 10-11
+    # cost ~50x the CPU of quality 4 for a few percent (see benchmarks/bench_compression.py)
+    app.config['COMPRESSION_ENABLED'] = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESSION_MIN_SIZE'] = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    app.config['COMPRESSION_GZIP_LEVEL'] = min(int(os.getenv('COMPRESSION_GZIP_LEVEL', 6)), 9)
+    app.config['COMPRESSION_BROTLI_QUALITY'] = min(int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4)), 9)
+    # logging: level, JSON log file (empty for stderr only) and its rotation
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+    app.config['LOG_FILE'] = os.getenv('LOG_FILE', os.path.join('logs', 'habit_free.log'))
+    app.config['LOG_MAX_BYTES'] = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['LOG_BACKUP_COUNT'] = int(os.getenv('LOG_BACKUP_COUNT', 10))
 
 # Database Models
+def utcnow():
+    return datetime.now(timezone.utc)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(15), unique=True, nullable=False)
-    password = db.Column(db.String(64), nullable=False)  # Store hashed password
+    password = db.Column(db.String(255), nullable=False)  # Store hashed password
     email = db.Column(db.String(120), unique=True, nullable=True)  # Add email field
+    # bumped on every change to the user's habits or messages; drives listing ETags
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     habits = db.relationship('Habit', backref='user', lazy=True)
     messages = db.relationship('Message', backref='user', lazy=True)
 
@@ -55,115 +203,681 @@ class User(db.Model):
         return f'<User {self.username}>'
 
 class Habit(db.Model):
+    __table_args__ = (
+        # serves /get_habits and the (id, user_id) ownership check in /delete
+        db.Index('ix_habit_user_id_id', 'user_id', 'id'),
+        # serves /sync, which reads one user's rows changed after a timestamp
+        db.Index('ix_habit_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     start_datetime = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    # last change, and when the row was deleted: deleted rows stay behind as
+    # tombstones for /sync until purge_tombstones() removes them
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=True)
 
     def __repr__(self):
         return f'<Habit {self.name} (ID: {self.id})>'
 
     def to_dict(self):
-        # ensure the datetime is timezone-aware and in UTC
-        start_time = self.start_datetime
-        if start_time.tzinfo is None:
-            start_time = pytz.utc.localize(start_time)
-        return {
-            'id': self.id,
-            'name': self.name,
-            'start_datetime': start_time.isoformat()  
-            }
+        return habit_dict(self)
 
 class Message(db.Model):
+    __table_args__ = (
+        # serves /get_messages and the ownership checks in delete/toggle
+        db.Index('ix_message_user_id_id', 'user_id', 'id'),
+        # serves the scheduler, which walks undelivered messages in (send_date, id)
+        # order; leading with deleted_at keeps delivered tombstones out of the range
+        db.Index('ix_message_undelivered', 'deleted_at', 'send_date', 'id'),
+        # serves GET /inbox, which lists one user's messages in a date window
+        db.Index('ix_message_user_id_send_date', 'user_id', 'send_date'),
+        # serves /sync
+        db.Index('ix_message_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.String(500), nullable=False)
-    send_date = db.Column(db.String(10), nullable=False)
+    send_date = db.Column(db.Date, nullable=False)
     is_masked = db.Column(db.Boolean, default=True)  # new field for masking state
+    # as on Habit; delivered messages become tombstones too
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=True)
 
     def __repr__(self):
         return f'<Message ID: {self.id} for {self.send_date}>'
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'message': self.message,
-            'send_date': self.send_date,
-            'is_masked': self.is_masked
-        }
+        return message_dict(self)
+
+class QuarantinedMessage(db.Model):
+    """A legacy message whose send_date could not be parsed, moved aside by migrate_send_dates()."""
+    id = db.Column(db.Integer, primary_key=True)  # the message's old id
+    user_id = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.String(500), nullable=False)
+    send_date = db.Column(db.Text)  # the unparseable value, as stored
+    is_masked = db.Column(db.Boolean)
+    quarantined_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f'<QuarantinedMessage ID: {self.id} with send_date {self.send_date!r}>'
+
+class AppliedOperation(db.Model):
+    """A /batch operation applied under a client-chosen op_id, kept so a replay returns the same result."""
+    __table_args__ = (
+        # serves the purge of old entries
+        db.Index('ix_applied_operation_created_at', 'created_at'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    op_id = db.Column(db.String(64), primary_key=True)
+    result = db.Column(db.Text, nullable=False)  # the JSON result first returned
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f'<AppliedOperation {self.op_id} of user {self.user_id}>'
+
+# read-only list endpoints select just these columns, so rows come back as
+# plain tuples instead of hydrated (and identity-mapped) ORM objects
+HABIT_COLUMNS = (Habit.id, Habit.name, Habit.start_datetime)
+MESSAGE_COLUMNS = (Message.id, Message.message, Message.send_date, Message.is_masked)
+
+def habit_dict(row):
+    """JSON fields of a Habit or a HABIT_COLUMNS row."""
+    # SQLite hands back naive datetimes; they are stored in UTC
+    start_time = row.start_datetime
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return {'id': row.id, 'name': row.name, 'start_datetime': start_time.isoformat()}
+
+def message_dict(row):
+    """JSON fields of a Message or a MESSAGE_COLUMNS row."""
+    return {'id': row.id, 'message': row.message, 'send_date': row.send_date.isoformat(),
+            'is_masked': row.is_masked}
+
+# indexes replaced by newer ones, and tables no longer used; migrate_schema() drops them
+OBSOLETE_INDEXES = ('ix_message_send_date_id',)
+OBSOLETE_TABLES = ('job_state',)
 
 # helper functions
+def migrate_schema():
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so indexes added to existing
+    tables are created here. Safe to run on every startup.
+    """
+    for table in (User.__table__, Habit.__table__, Message.__table__):
+        add_missing_columns(table)
+    for table in (Habit.__table__, Message.__table__):
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        for name in OBSOLETE_TABLES:
+            conn.execute(text(f'DROP TABLE IF EXISTS {name}'))
+    migrate_send_dates()
+    backfill_updated_at()
+
+def add_missing_columns(table):
+    """ALTER TABLE ... ADD COLUMN for model columns an older database lacks.
+
+    New columns must be nullable or carry a server_default.
+    """
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    preparer = db.engine.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} ' \
+              f'{column.type.compile(dialect=db.engine.dialect)}'
+        if column.server_default is not None:
+            ddl += f' NOT NULL DEFAULT {column.server_default.arg}' if not column.nullable \
+                else f' DEFAULT {column.server_default.arg}'
+        with db.engine.begin() as conn:
+            conn.execute(text(ddl))
+        current_app.logger.info(f'Added column {table.name}.{column.name}')
+
+def backfill_updated_at(batch_size=None):
+    """Stamp rows from before updated_at existed with the migration time, in batches.
+
+    The column is added without a default (SQLite can't add one that isn't
+    constant), so older rows start out NULL and would never reach /sync.
+    """
+    batch_size = batch_size or current_app.config['MIGRATION_BATCH_SIZE']
+    stamped = 0
+    for model in (Habit, Message):
+        while True:
+            ids = select(model.id).where(model.updated_at.is_(None)).limit(batch_size).scalar_subquery()
+            count = db.session.execute(update(model).where(model.id.in_(ids))
+                                       .values(updated_at=utcnow())
+                                       .execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            stamped += count
+            if count < batch_size:
+                break
+    if stamped:
+        current_app.logger.info(f'Stamped updated_at on {stamped} existing rows')
+    return stamped
+
+def parse_send_date(value):
+    """Parse a YYYY-MM-DD string (zero padding optional) into a date."""
+    return datetime.strptime(value.strip()[:10], '%Y-%m-%d').date()
+
+def migrate_send_dates(batch_size=None):
+    """Rewrite legacy send_date strings into canonical ISO dates, in batches.
+
+    send_date used to be a free-form String(10). SQLite stores the Date type as
+    'YYYY-MM-DD' text, so canonical values need no change; anything else (for
+    example '2025-1-5') would sort wrongly in range scans and is rewritten here.
+    Values that aren't real dates (the old /inbox took any string, including
+    well-formed ones like '2020-02-30') would make every read of the row fail,
+    so those messages are moved to the quarantined_message table instead. Every
+    row is parsed, since the shape alone doesn't prove a date is valid. Each
+    batch commits on its own, so the app keeps serving while it runs.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+
+    batch_size = batch_size or current_app.config['MIGRATION_BATCH_SIZE']
+    converted = quarantined = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, user_id, message, send_date, is_masked FROM message "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).all()
+        if not rows:
+            break
+
+        updates, invalid = [], []
+        for row in rows:
+            try:
+                canonical = parse_send_date(str(row.send_date)).isoformat()
+                if canonical != row.send_date:
+                    updates.append({'id': row.id, 'send_date': canonical})
+            except ValueError:
+                current_app.logger.warning(f'Cannot convert send_date {row.send_date!r} of message {row.id}; '
+                                           f'moving it to quarantined_message')
+                invalid.append({'id': row.id, 'user_id': row.user_id, 'message': row.message,
+                                'send_date': None if row.send_date is None else str(row.send_date),
+                                'is_masked': row.is_masked, 'quarantined_at': utcnow()})
+        if updates:
+            db.session.execute(text("UPDATE message SET send_date = :send_date WHERE id = :id"), updates)
+        if invalid:
+            db.session.execute(insert(QuarantinedMessage.__table__), invalid)
+            db.session.execute(text("DELETE FROM message WHERE id = :id"), [{'id': row['id']} for row in invalid])
+            bump_data_version({row['user_id'] for row in invalid})
+        db.session.commit()
+
+        converted += len(updates)
+        quarantined += len(invalid)
+        last_id = rows[-1].id
+
+    if converted:
+        current_app.logger.info(f'Converted {converted} legacy send_date values')
+    if quarantined:
+        current_app.logger.warning(f'Quarantined {quarantined} messages with unparseable send_date values')
+    return converted
+
+# password hashing
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+def _b64decode(value):
+    return base64.b64decode(value + '=' * (-len(value) % 4))
+
+class ScryptHasher:
+    """scrypt, encoded as 'scrypt$n=..,r=..,p=..$salt$hash'."""
+    algorithm = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n, self.r, self.p = n, r, p
+
+    def _derive(self, password, salt, n, r, p):
+        # scrypt needs 128 * r * n bytes; leave headroom above OpenSSL's 32 MB default
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n + 2 ** 20, dklen=32)
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        derived = self._derive(password, salt, self.n, self.r, self.p)
+        return f'{self.algorithm}$n={self.n},r={self.r},p={self.p}${_b64encode(salt)}${_b64encode(derived)}'
+
+    def _params(self, encoded):
+        _, params, salt, derived = encoded.split('$')
+        params = dict(item.split('=') for item in params.split(','))
+        return int(params['n']), int(params['r']), int(params['p']), _b64decode(salt), _b64decode(derived)
+
+    def verify(self, password, encoded):
+        n, r, p, salt, derived = self._params(encoded)
+        return hmac.compare_digest(self._derive(password, salt, n, r, p), derived)
+
+    def needs_rehash(self, encoded):
+        return self._params(encoded)[:3] != (self.n, self.r, self.p)
+
+class PBKDF2Hasher:
+    """PBKDF2-HMAC-SHA256, encoded as 'pbkdf2_sha256$iterations$salt$hash'."""
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        derived = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f'{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(derived)}'
+
+    def verify(self, password, encoded):
+        _, iterations, salt, derived = encoded.split('$')
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(salt), int(iterations))
+        return hmac.compare_digest(candidate, _b64decode(derived))
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split('$')[1]) != self.iterations
+
+class LegacySHA256Hasher:
+    """Unsalted hex SHA-256 from before the KDF hashers. Verify only."""
+    algorithm = 'sha256'
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+
+    def needs_rehash(self, encoded):
+        return True
+
+PASSWORD_HASHERS = {
+    ScryptHasher.algorithm: ScryptHasher,
+    PBKDF2Hasher.algorithm: PBKDF2Hasher,
+}
+
+def get_password_hasher():
+    """Build the hasher selected by PASSWORD_HASHER with its configured cost."""
+    name = current_app.config['PASSWORD_HASHER']
+    if name == ScryptHasher.algorithm:
+        return ScryptHasher(n=current_app.config['SCRYPT_N'], r=current_app.config['SCRYPT_R'], p=current_app.config['SCRYPT_P'])
+    if name == PBKDF2Hasher.algorithm:
+        return PBKDF2Hasher(iterations=current_app.config['PBKDF2_ITERATIONS'])
+    raise ValueError(f'Unknown PASSWORD_HASHER {name!r}, expected one of {sorted(PASSWORD_HASHERS)}')
+
+def _hasher_for(encoded):
+    algorithm = encoded.split('$', 1)[0] if '$' in encoded else LegacySHA256Hasher.algorithm
+    if algorithm == LegacySHA256Hasher.algorithm:
+        return LegacySHA256Hasher()
+    return PASSWORD_HASHERS[algorithm]()
+
+# hashlib releases the GIL during scrypt/PBKDF2, so a bounded pool keeps the
+# KDF cost (and scrypt's memory) off the request threads and capped per process
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+def kdf_pool():
+    global _kdf_pool
+    with _kdf_pool_lock:
+        if _kdf_pool is None:
+            _kdf_pool = ThreadPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_WORKERS'],
+                                           thread_name_prefix='kdf')
+        return _kdf_pool
+
+# recently verified (hash, password) pairs, keyed by an HMAC under a per-process
+# key so the plaintext never sits in memory; expires after PASSWORD_CACHE_TTL
+_verify_cache = OrderedDict()
+_verify_cache_lock = threading.Lock()
+_verify_cache_key = os.urandom(32)
+
+def _verify_cache_token(password, encoded):
+    return hmac.new(_verify_cache_key, f'{encoded}\0{password}'.encode(), hashlib.sha256).digest()
+
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with the configured KDF, on the KDF thread pool."""
+    return kdf_pool().submit(get_password_hasher().encode, password).result()
+
+def verify_password(password, encoded):
+    """Check a password against a stored hash of any supported format.
+
+    Returns (matches, needs_rehash). needs_rehash is True when the hash is a
+    legacy SHA-256 digest or was made with a different algorithm or cost than
+    the current configuration.
+    """
+    token = _verify_cache_token(password, encoded)
+    now = time.monotonic()
+    with _verify_cache_lock:
+        expires = _verify_cache.get(token)
+        if expires and expires > now:
+            _verify_cache.move_to_end(token)
+            return True, False
+
+    hasher = _hasher_for(encoded)
+    matches = kdf_pool().submit(hasher.verify, password, encoded).result()
+    if not matches:
+        return False, False
+
+    current = get_password_hasher()
+    needs_rehash = hasher.algorithm != current.algorithm or current.needs_rehash(encoded)
+    if not needs_rehash:
+        with _verify_cache_lock:
+            _verify_cache[token] = now + current_app.config['PASSWORD_CACHE_TTL']
+            _verify_cache.move_to_end(token)
+            while len(_verify_cache) > current_app.config['PASSWORD_CACHE_SIZE']:
+                _verify_cache.popitem(last=False)
+    return True, needs_rehash
+
+# session tokens
+def _session_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='habit-free-session')
+
+# validated tokens -> (identity, expiry as a wall-clock timestamp), in LRU order
+_session_cache = OrderedDict()
+_session_cache_lock = threading.Lock()
+
+class AuthError(Exception):
+    pass
+
+def issue_session_token(user):
+    """Return a signed token identifying `user`, valid for SESSION_TOKEN_TTL seconds."""
+    return _session_serializer().dumps({'uid': user.id, 'u': user.username})
+
+def validate_session_token(token):
+    """Return the {'uid', 'u'} identity in a session token, or raise AuthError.
+
+    Tokens are self-contained, so validation never touches the User table.
+    Recently seen tokens are answered from a bounded LRU cache; entries expire
+    together with the token itself.
+    """
+    now = time.time()
+    with _session_cache_lock:
+        cached = _session_cache.get(token)
+        if cached:
+            identity, expires = cached
+            if expires > now:
+                _session_cache.move_to_end(token)
+                return identity
+            del _session_cache[token]
+
+    ttl = current_app.config['SESSION_TOKEN_TTL']
+    try:
+        identity, signed_at = _session_serializer().loads(token, max_age=ttl, return_timestamp=True)
+    except SignatureExpired:
+        raise AuthError('Session expired, please log in again')
+    except BadSignature:
+        raise AuthError('Invalid session token')
+
+    with _session_cache_lock:
+        _session_cache[token] = (identity, signed_at.timestamp() + ttl)
+        _session_cache.move_to_end(token)
+        while len(_session_cache) > current_app.config['SESSION_CACHE_SIZE']:
+            _session_cache.popitem(last=False)
+    return identity
+
+def _request_token():
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[len('Bearer '):].strip()
+    return request.values.get('session_cookie')
+
+def login_required(view):
+    """Resolve the calling user into g.user_id before running the view.
+
+    The user comes from the session token (Authorization: Bearer <token>, or
+    a session_cookie parameter). Clients that predate tokens may send a
+    user_id parameter instead only while AUTH_ALLOW_USER_ID_PARAM is enabled.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _request_token()
+        if token:
+            try:
+                identity = validate_session_token(token)
+            except AuthError as e:
+                return jsonify({'success': False, 'message': str(e)}), 401
+            g.user_id = identity['uid']
+            g.username = identity['u']
+        elif current_app.config['AUTH_ALLOW_USER_ID_PARAM'] and request.values.get('user_id'):
+            g.user_id = request.values.get('user_id')
+            g.username = None
+        elif current_app.config['AUTH_ALLOW_USER_ID_PARAM']:
+            return jsonify({'success': False, 'message': 'User ID required'}), 400
+        else:
+            return jsonify({'success': False, 'message': 'Session token required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+DELIVERY_JOB = 'deliver_messages'
+
+def deliver_messages(end_date, chunk_size=None):
+    """Deliver and delete every message due on or before end_date.
+
+    There is no lower date bound: rows saved with a past send_date (the API and
+    /import accept them) must still go out. Delivered rows become tombstones, so
+    the scan is a range read on (send_date, id) over undelivered messages only.
+    Messages are read with one indexed range query per chunk, joined to their
+    users, and soft-deleted in bulk, so the write lock is only held for one short transaction
+    at a time. Returns a dict with the number of delivered messages and
+    per-chunk timings.
+    """
+    chunk_size = chunk_size or current_app.config['DELIVERY_CHUNK_SIZE']
+    stats = {'end_date': end_date, 'delivered': 0, 'chunks': []}
+
+    due = [Message.send_date <= end_date, Message.deleted_at.is_(None)]
+    last_key = None
+
+    while True:
+        chunk_start = time.perf_counter()
+
+        # keyset on (send_date, id) so orphaned rows (no matching user) never stall the loop
+        query = (db.session.query(Message.id, Message.send_date, Message.message, User.id.label('user_id'), User.username)
+                 .join(User, User.id == Message.user_id)
+                 .filter(*due))
+        if last_key:
+            query = query.filter(tuple_(Message.send_date, Message.id) > last_key)
+        rows = query.order_by(Message.send_date, Message.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        for row in rows:
+            current_app.logger.info(f'Message for user {row.username}: {row.message}',
+                                    extra={'user_id': row.user_id, 'message_id': row.id})
+
+        ids = [row.id for row in rows]
+        # by primary key alone: given deleted_at too, SQLite walks ix_message_undelivered instead
+        soft_delete(Message, Message.id.in_(ids), live_only=False)
+        bump_data_version({row.user_id for row in rows})
+        db.session.commit()
+
+        last_key = (rows[-1].send_date, rows[-1].id)
+        elapsed = time.perf_counter() - chunk_start
+        stats['delivered'] += len(ids)
+        stats['chunks'].append({'size': len(ids), 'seconds': round(elapsed, 4)})
+        current_app.logger.info(f'Delivered chunk of {len(ids)} messages in {elapsed:.3f}s',
+                                extra={'delivered': len(ids), 'seconds': round(elapsed, 4)})
+
+        if len(rows) < chunk_size:
+            break
+
+    return stats
+
+TOMBSTONE_PURGE_JOB = 'purge_tombstones'
+
+def purge_tombstones(chunk_size=None):
+    """Remove habits and messages deleted more than SYNC_TOMBSTONE_DAYS ago,
+    and /batch op_ids older than BATCH_OP_ID_DAYS.
+
+    Walks each table in id order, deleting a chunk per transaction. Returns a
+    dict with the number of purged rows, or None on error.
+    """
+    chunk_size = chunk_size or current_app.config['DELIVERY_CHUNK_SIZE']
+    try:
+        cutoff = utcnow() - timedelta(days=current_app.config['SYNC_TOMBSTONE_DAYS'])
+        stats = {'purged': 0}
+        for model in (Habit, Message):
+            last_id = 0
+            while True:
+                ids = db.session.execute(select(model.id)
+                                         .where(model.deleted_at < cutoff, model.id > last_id)
+                                         .order_by(model.id).limit(chunk_size)).scalars().all()
+                if not ids:
+                    break
+                db.session.execute(delete(model).where(model.id.in_(ids)))
+                db.session.commit()
+                stats['purged'] += len(ids)
+                last_id = ids[-1]
+        op_id_cutoff = utcnow() - timedelta(days=current_app.config['BATCH_OP_ID_DAYS'])
+        stats['op_ids'] = db.session.execute(delete(AppliedOperation)
+                                             .where(AppliedOperation.created_at < op_id_cutoff)).rowcount
+        db.session.commit()
+        current_app.logger.info(f"Purged {stats['purged']} tombstones deleted before {cutoff.isoformat()} "
+                                f"and {stats['op_ids']} batch op_ids",
+                                extra={'purged': stats['purged'], 'op_ids': stats['op_ids']})
+        return stats
+    except Exception as e:
+        current_app.logger.exception(f'Error purging tombstones: {e}')
+        db.session.rollback()
+
+def bump_data_version(user_ids):
+    """Invalidate the listing ETags of one user id or a set of them, within the current transaction."""
+    if not isinstance(user_ids, (set, list, tuple)):
+        user_ids = [user_ids]
+    db.session.execute(update(User)
+                       .where(User.id.in_(user_ids))
+                       .values(data_version=User.data_version + 1))
+
+def soft_delete(model, *criteria, live_only=True):
+    """Turn the live rows of `model` matching `criteria` into tombstones; returns how many.
+
+    live_only=False skips the deleted_at check, for rows the caller has just read as live.
+    """
+    now = utcnow()
+    if live_only:
+        criteria = (model.deleted_at.is_(None),) + criteria
+    return db.session.execute(update(model)
+                              .where(*criteria)
+                              .values(deleted_at=now, updated_at=now)
+                              .execution_options(synchronize_session=False)).rowcount
+
+def listing_etag(user_id, limit, cursor):
+    """ETag for one page of a user's listing, from a single primary-key read."""
+    version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+    if version is None:
+        return None
+    return f'{request.endpoint}-{user_id}-{version}-{limit}-{cursor}'
+
+def not_modified(etag):
+    """A 304 response when the client already holds `etag`, else None.
+
+    Compressed responses carry `etag` with the encoding appended (see
+    init_compression), so the client may hold that variant instead.
+    """
+    if not etag:
+        return None
+    candidates = [etag]
+    if current_app.config['COMPRESSION_ENABLED']:
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding:
+            candidates.insert(0, f'{etag}-{encoding}')
+    for candidate in candidates:
+        if request.if_none_match.contains(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            return response
+    return None
+
+def page_args():
+    """Read `limit` and `cursor` from the query string, or raise ValueError."""
+    try:
+        limit = int(request.args.get('limit', current_app.config['PAGE_SIZE_DEFAULT']))
+        cursor = int(request.args.get('cursor', 0))
+    except ValueError:
+        raise ValueError('limit and cursor must be integers')
+    if limit < 1 or cursor < 0:
+        raise ValueError('limit must be positive and cursor non-negative')
+    return min(limit, current_app.config['PAGE_SIZE_MAX']), cursor
+
+def paginate(query, model, limit, cursor):
+    """Return one keyset page of `query` ordered by id, and the cursor of the next page.
+
+    The cursor is the last id returned, so each page is a range read on the
+    (user_id, id) index no matter how deep the client has scrolled.
+    """
+    rows = query.filter(model.id > cursor).order_by(model.id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 def check_and_send_messages():
-    """Check for messages that need to be displayed today."""
+    """Deliver every message due up to today, including any saved for a past date.
+
+    Delivery has no lower date bound, so if the process was down at midnight
+    the next run (at startup or the following midnight) delivers every missed
+    day in one batched range pass.
+    """
     try:
         today = datetime.now(timezone.utc).date()
-        today_str = today.strftime('%Y-%m-%d')
-        
-        # get all messages scheduled for today
-        messages = Message.query.filter_by(send_date=today_str).all()
-        
-        for message in messages:
-            user = User.query.get(message.user_id)
-            if user:
-                print(f"Message for user {user.username}: {message.message}")
-                
-                # optionally delete the message after displaying
-                db.session.delete(message)
-        
-        db.session.commit()
-        print(f"Checked messages for {today_str}")
+        stats = deliver_messages(today)
+
+        current_app.logger.info(f"Checked messages due up to {today.isoformat()}: "
+                                f"delivered {stats['delivered']} in {len(stats['chunks'])} chunks",
+                                extra={'delivered': stats['delivered'], 'chunks': len(stats['chunks'])})
+        metrics.inc('habit_free_messages_delivered_total', value=stats['delivered'])
+        return stats
     except Exception as e:
-        print(f"Error checking messages: {e}")
+        current_app.logger.exception(f'Error checking messages: {e}')
         db.session.rollback()
 
 # route handlers
-@app.route('/')
+@api.route('/')
 def home():
     return "Welcome to Habit Free API !"
 
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 def register():
     try:
         data = request.form
         username = data.get('username')
         password = data.get('password')
         
-        app.logger.info(f'Registration attempt for user: {username}')
+        current_app.logger.info(f'Registration attempt for user: {username}')
         
         if not username or not password:
-            app.logger.warning('Missing username or password in registration')
+            current_app.logger.warning('Missing username or password in registration')
             return jsonify({'success': False, 'message': 'Username and password required'}), 400
         
         if not (3 <= len(username) <= 15) or not username.isalnum():
-            app.logger.warning(f'Invalid username format: {username}')
+            current_app.logger.warning(f'Invalid username format: {username}')
             return jsonify({'success': False, 'message': 'Invalid username format'}), 400
         
         if len(password) < 4:
-            app.logger.warning('Password too short in registration')
+            current_app.logger.warning('Password too short in registration')
             return jsonify({'success': False, 'message': 'Password too short'}), 400
         
+        if User.query.filter_by(username=username).first():
+            current_app.logger.warning(f'Username already taken: {username}')
+            return jsonify({'success': False, 'message': 'Username already taken'}), 409
+        
         hashed_password = hash_password(password)
         
         new_user = User(username=username, password=hashed_password)
         db.session.add(new_user)
         db.session.commit()
         
-        app.logger.info(f'Successfully registered user: {username}')
+        current_app.logger.info(f'Successfully registered user: {username}')
         return jsonify({
             'success': True,
             'message': 'Registration successful',
             'user_id': new_user.id,
-            'session_cookie': 'dummy_session'
+            'session_cookie': issue_session_token(new_user)
         })
+    except IntegrityError:
+        # lost a race with a concurrent registration of the same name
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Username already taken'}), 409
     except Exception as e:
-        app.logger.error(f'Registration error: {str(e)}')
+        current_app.logger.error(f'Registration error: {str(e)}')
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     data = request.form
     username = data.get('username')
@@ -182,41 +896,62 @@ def login():
             }), 401
         
         # then check password
-        hashed_password = hash_password(password)
-        if user.password != hashed_password:
+        matches, needs_rehash = verify_password(password, user.password)
+        if not matches:
             return jsonify({
                 'success': False, 
                 'message': 'Incorrect password. Please try again.'
             }), 401
+
+        # upgrade legacy or outdated hashes while we have the plaintext
+        if needs_rehash:
+            user.password = hash_password(password)
+            db.session.commit()
+            current_app.logger.info(f'Rehashed password for user: {username}')
         
         return jsonify({
             'success': True,
             'message': 'Login successful',
             'user_id': user.id,
-            'session_cookie': 'dummy_session'  # in a real app, generate proper session
+            'session_cookie': issue_session_token(user)
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/get_habits', methods=['GET'])
+@api.route('/get_habits', methods=['GET'])
+@login_required
 def get_habits():
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({'success': False, 'message': 'User ID required'}), 400
+    user_id = g.user_id
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     try:
-        habits = Habit.query.filter_by(user_id=user_id).all()
-        return jsonify({
+        etag = listing_etag(user_id, limit, cursor)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        habits, next_cursor = paginate(db.session.query(*HABIT_COLUMNS)
+                                       .filter(Habit.user_id == user_id, Habit.deleted_at.is_(None)),
+                                       Habit, limit, cursor)
+        response = jsonify({
             'success': True,
-            'habits': [habit.to_dict() for habit in habits]
+            'habits': [habit_dict(habit) for habit in habits],
+            'next_cursor': next_cursor
         })
+        if etag:
+            response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/add', methods=['POST'])
+@api.route('/add', methods=['POST'])
+@login_required
 def add_habit():
     data = request.form
-    user_id = data.get('user_id')
+    user_id = g.user_id
     name = data.get('name')
     
     if not user_id or not name:
@@ -225,6 +960,7 @@ def add_habit():
     try:
         new_habit = Habit(user_id=user_id, name=name)
         db.session.add(new_habit)
+        bump_data_version(user_id)
         db.session.commit()
         
         return jsonify({
@@ -236,16 +972,14 @@ def add_habit():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/delete/<int:habit_id>', methods=['DELETE'])
+@api.route('/delete/<int:habit_id>', methods=['DELETE'])
+@login_required
 def delete_habit(habit_id):
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({'success': False, 'message': 'User ID required'}), 400
+    user_id = g.user_id
     
     try:
-        habit = Habit.query.filter_by(id=habit_id, user_id=user_id).first()
-        if habit:
-            db.session.delete(habit)
+        if soft_delete(Habit, Habit.id == habit_id, Habit.user_id == user_id):
+            bump_data_version(user_id)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Habit deleted successfully'})
         else:
@@ -254,34 +988,55 @@ def delete_habit(habit_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/get_messages', methods=['GET'])
+@api.route('/get_messages', methods=['GET'])
+@login_required
 def get_messages():
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({'success': False, 'message': 'User ID required'}), 400
+    user_id = g.user_id
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     try:
-        messages = Message.query.filter_by(user_id=user_id).all()
-        return jsonify({
+        etag = listing_etag(user_id, limit, cursor)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        messages, next_cursor = paginate(db.session.query(*MESSAGE_COLUMNS)
+                                         .filter(Message.user_id == user_id, Message.deleted_at.is_(None)),
+                                         Message, limit, cursor)
+        response = jsonify({
             'success': True,
-            'messages': [message.to_dict() for message in messages]
+            'messages': [message_dict(message) for message in messages],
+            'next_cursor': next_cursor
         })
+        if etag:
+            response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/inbox', methods=['POST'])
+@api.route('/inbox', methods=['POST'])
+@login_required
 def save_message():
     data = request.form
-    user_id = data.get('user_id')
+    user_id = g.user_id
     message = data.get('message')
     date = data.get('date')
     
     if not all([user_id, message, date]):
         return jsonify({'success': False, 'message': 'All fields required'}), 400
+
+    try:
+        send_date = parse_send_date(date)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Date must be in YYYY-MM-DD format'}), 400
     
     try:
-        new_message = Message(user_id=user_id, message=message, send_date=date)
+        new_message = Message(user_id=user_id, message=message, send_date=send_date)
         db.session.add(new_message)
+        bump_data_version(user_id)
         db.session.commit()
         
         return jsonify({
@@ -293,16 +1048,47 @@ def save_message():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/delete_message/<int:message_id>', methods=['DELETE'])
+@api.route('/inbox', methods=['GET'])
+@login_required
+def get_inbox():
+    """List a user's messages due between `start` and `end` (inclusive).
+
+    Defaults to the next 7 days starting today (UTC).
+    """
+    user_id = g.user_id
+
+    try:
+        today = datetime.now(timezone.utc).date()
+        start = parse_send_date(request.args['start']) if request.args.get('start') else today
+        end = parse_send_date(request.args['end']) if request.args.get('end') else start + timedelta(days=7)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    try:
+        messages = (db.session.query(*MESSAGE_COLUMNS)
+                    .filter(Message.user_id == user_id,
+                            Message.send_date >= start,
+                            Message.send_date <= end,
+                            Message.deleted_at.is_(None))
+                    .order_by(Message.send_date, Message.id)
+                    .all())
+        return jsonify({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'messages': [message_dict(message) for message in messages]
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@api.route('/delete_message/<int:message_id>', methods=['DELETE'])
+@login_required
 def delete_message(message_id):
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({'success': False, 'message': 'User ID required'}), 400
+    user_id = g.user_id
     
     try:
-        message = Message.query.filter_by(id=message_id, user_id=user_id).first()
-        if message:
-            db.session.delete(message)
+        if soft_delete(Message, Message.id == message_id, Message.user_id == user_id):
+            bump_data_version(user_id)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Message deleted successfully'})
         else:
@@ -311,16 +1097,16 @@ def delete_message(message_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/toggle_message_mask/<int:message_id>', methods=['POST'])
+@api.route('/toggle_message_mask/<int:message_id>', methods=['POST'])
+@login_required
 def toggle_message_mask(message_id):
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({'success': False, 'message': 'User ID required'}), 400
+    user_id = g.user_id
     
     try:
-        message = Message.query.filter_by(id=message_id, user_id=user_id).first()
+        message = Message.query.filter_by(id=message_id, user_id=user_id, deleted_at=None).first()
         if message:
             message.is_masked = not message.is_masked
+            bump_data_version(user_id)
             db.session.commit()
             return jsonify({
                 'success': True,
@@ -333,47 +1119,937 @@ def toggle_message_mask(message_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-# schedule the message checker to run daily at midnight
-scheduler.add_job(
-    check_and_send_messages,
-    'cron',
-    hour=0,
-    minute=0,
-    timezone=pytz.UTC
-)
+# batch operations: each takes (user_id, op) and returns (success, response fields)
+# without committing, so /batch can apply a whole list in one transaction. They
+# check types and lengths first: an error raised here would roll back the batch
+def _batch_id(op):
+    """The op's positive integer `id`, or None."""
+    row_id = op.get('id')
+    if isinstance(row_id, bool) or not isinstance(row_id, int) or not 0 < row_id < 2 ** 63:
+        return None
+    return row_id
 
-# initialize the app and run first check
-def init_app(app):
-    with app.app_context():
-        db.create_all()
-        check_and_send_messages()
+def _batch_text(op, key, max_length):
+    """The op's non-empty string `key` of at most max_length characters, or None."""
+    value = op.get(key)
+    if not isinstance(value, str) or not value or len(value) > max_length:
+        return None
+    return value
+
+def _batch_add_habit(user_id, op):
+    name = _batch_text(op, 'name', 100)
+    if name is None:
+        return False, {'message': 'Habit name required (at most 100 characters)'}
+    habit = Habit(user_id=user_id, name=name)
+    db.session.add(habit)
+    db.session.flush()
+    return True, {'message': 'Habit added successfully', 'habit': habit.to_dict()}
+
+def _batch_delete_habit(user_id, op):
+    habit_id = _batch_id(op)
+    if habit_id is None:
+        return False, {'message': 'Habit id must be a positive integer'}
+    deleted = soft_delete(Habit, Habit.id == habit_id, Habit.user_id == user_id)
+    if not deleted:
+        return False, {'message': 'Habit not found'}
+    return True, {'message': 'Habit deleted successfully'}
+
+def _batch_save_message(user_id, op):
+    body = _batch_text(op, 'message', 500)
+    date = op.get('date')
+    if body is None or not isinstance(date, str) or not date:
+        return False, {'message': 'Message text (at most 500 characters) and date required'}
+    try:
+        send_date = parse_send_date(date)
+    except ValueError:
+        return False, {'message': 'Date must be in YYYY-MM-DD format'}
+    message = Message(user_id=user_id, message=body, send_date=send_date)
+    db.session.add(message)
+    db.session.flush()
+    return True, {'message': 'Message saved successfully', 'message_data': message.to_dict()}
+
+def _batch_delete_message(user_id, op):
+    message_id = _batch_id(op)
+    if message_id is None:
+        return False, {'message': 'Message id must be a positive integer'}
+    deleted = soft_delete(Message, Message.id == message_id, Message.user_id == user_id)
+    if not deleted:
+        return False, {'message': 'Message not found'}
+    return True, {'message': 'Message deleted successfully'}
+
+def _batch_toggle_message_mask(user_id, op):
+    message_id = _batch_id(op)
+    if message_id is None:
+        return False, {'message': 'Message id must be a positive integer'}
+    if 'is_masked' in op and not isinstance(op['is_masked'], bool):
+        return False, {'message': 'is_masked must be true or false'}
+    message = Message.query.filter_by(id=message_id, user_id=user_id, deleted_at=None).first()
+    if not message:
+        return False, {'message': 'Message not found'}
+    # an explicit target state makes the operation safe to replay from a client outbox
+    message.is_masked = op['is_masked'] if 'is_masked' in op else not message.is_masked
+    return True, {'message': 'Message mask toggled successfully', 'message_data': message.to_dict()}
+
+BATCH_OPERATIONS = {
+    'add_habit': _batch_add_habit,
+    'delete_habit': _batch_delete_habit,
+    'save_message': _batch_save_message,
+    'delete_message': _batch_delete_message,
+    'toggle_message_mask': _batch_toggle_message_mask,
+}
+
+@api.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """Apply a list of habit/message operations in one transaction.
 
-@app.errorhandler(404)
+    Body: {"operations": [{"op": "add_habit", "name": ...}, {"op": "delete_message", "id": ...}, ...]}
+    Operations run in order. One that fails validation or targets a missing
+    row is reported in its result and skipped; the others still apply.
+
+    An operation may carry an "op_id" chosen by the client. Once it has been
+    applied, resending it (say, after the response was lost) returns the first
+    result again instead of applying it twice, for BATCH_OP_ID_DAYS.
+    """
+    user_id = g.user_id
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'A non-empty operations list is required'}), 400
+    if len(operations) > current_app.config['BATCH_MAX_OPERATIONS']:
+        return jsonify({'success': False,
+                        'message': f"At most {current_app.config['BATCH_MAX_OPERATIONS']} operations per batch"}), 400
+
+    try:
+        # results of operations applied before, by op_id: one primary-key range read for the batch
+        op_ids = [op['op_id'] for op in operations if isinstance(op, dict) and isinstance(op.get('op_id'), str)]
+        applied = dict(db.session.query(AppliedOperation.op_id, AppliedOperation.result)
+                       .filter(AppliedOperation.user_id == user_id, AppliedOperation.op_id.in_(op_ids))
+                       .all()) if op_ids else {}
+
+        results = []
+        for op in operations:
+            name = op.get('op') if isinstance(op, dict) else None
+            handler = BATCH_OPERATIONS.get(name) if isinstance(name, str) else None
+            if handler is None:
+                results.append({'success': False, 'message': 'Unknown operation'})
+                continue
+            op_id = op.get('op_id')
+            if op_id is not None and (not isinstance(op_id, str) or not 0 < len(op_id) <= 64):
+                results.append({'success': False, 'message': 'op_id must be a string of 1 to 64 characters'})
+                continue
+            if op_id in applied:
+                results.append(current_app.json.loads(applied[op_id]))
+                continue
+            success, fields = handler(user_id, op)
+            result = {'success': success, **fields}
+            if success and op_id:
+                applied[op_id] = current_app.json.dumps(result)
+                db.session.add(AppliedOperation(user_id=user_id, op_id=op_id, result=applied[op_id]))
+            results.append(result)
+
+        if any(result['success'] for result in results):
+            bump_data_version(user_id)
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'message': f"Applied {sum(result['success'] for result in results)} of {len(results)} operations",
+            'results': results
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# delta sync: the client sends the token of its last sync back and gets only the
+# rows created, changed or deleted since, so a refresh costs what changed
+SYNC_TABLES = (('habits', Habit, HABIT_COLUMNS, habit_dict),
+               ('messages', Message, MESSAGE_COLUMNS, message_dict))
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def sync_token(moment):
+    """The since-token for a server time: microseconds since the epoch, as a string."""
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+def parse_sync_token(token):
+    try:
+        return EPOCH + timedelta(microseconds=int(token))
+    except (ValueError, OverflowError):
+        raise ValueError('since must be a token returned by /sync')
+
+def sync_cursor(started, after):
+    """The cursor of the next reset page: the reset's start token, then the last id sent from each table."""
+    return '.'.join([sync_token(started)] + [str(after[key]) for key, *_ in SYNC_TABLES])
+
+def parse_sync_cursor(cursor):
+    try:
+        token, *ids = cursor.split('.')
+        if len(ids) != len(SYNC_TABLES):
+            raise ValueError
+        return parse_sync_token(token), {key: int(row_id) for (key, *_), row_id in zip(SYNC_TABLES, ids)}
+    except ValueError:
+        raise ValueError('cursor must be a next_cursor returned by /sync')
+
+@api.route('/sync', methods=['GET'])
+@login_required
+def sync():
+    """Changes to a user's habits and messages since an earlier sync.
+
+    `since` is the token of the previous response. Each table is read with one
+    range query on its (user_id, updated_at) index; live rows come back in full
+    and deleted ones as ids under `deleted`. Without a token, or with one older
+    than the tombstone retention, the response holds live rows and
+    `reset: true`: the client replaces what it has instead of merging.
+
+    A reset is paged, SYNC_PAGE_SIZE rows per table, on (user_id, id). While
+    rows remain, `next_cursor` is set and the client asks for `?cursor=` and
+    adds that page to the first. Every page carries the `since` of the first,
+    so the next delta also picks up whatever changed while the pages were read.
+    """
+    user_id = g.user_id
+    try:
+        since = parse_sync_token(request.args['since']) if request.args.get('since') else None
+        started, after = parse_sync_cursor(request.args['cursor']) if request.args.get('cursor') else (None, None)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        if started is None:
+            started, after = utcnow(), {key: 0 for key, *_ in SYNC_TABLES}
+            # deletes older than the retention may have been purged, so such a token can't be trusted
+            reset = since is None or since < started - timedelta(days=current_app.config['SYNC_TOMBSTONE_DAYS'])
+        else:
+            reset = True  # a later page of a reset
+        # rows are stamped before their transaction commits; re-reading a short window
+        # before the token catches commits that landed after the previous sync's read
+        changed_after = None if reset else since - timedelta(seconds=current_app.config['SYNC_OVERLAP_SECONDS'])
+        page_size = current_app.config['SYNC_PAGE_SIZE']
+        body = {'success': True, 'since': sync_token(started), 'reset': reset, 'deleted': {}, 'next_cursor': None}
+        more = False
+        for key, model, columns, to_dict in SYNC_TABLES:
+            query = db.session.query(*columns, model.deleted_at).filter(model.user_id == user_id)
+            if reset:
+                rows = (query.filter(model.deleted_at.is_(None), model.id > after[key])
+                        .order_by(model.id).limit(page_size + 1).all())
+                more = more or len(rows) > page_size
+                rows = rows[:page_size]
+                after[key] = rows[-1].id if rows else after[key]
+            else:
+                rows = query.filter(model.updated_at > changed_after).order_by(model.id).all()
+            body[key] = [to_dict(row) for row in rows if row.deleted_at is None]
+            body['deleted'][key] = [row.id for row in rows if row.deleted_at is not None]
+        if more:
+            body['next_cursor'] = sync_cursor(started, after)
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# NDJSON export/import: one JSON object per line, each tagged with a "type"
+EXPORT_FORMAT_VERSION = 1
+
+@api.route('/export', methods=['GET'])
+@login_required
+def export_history():
+    """Stream all of a user's habits and messages as NDJSON.
+
+    Rows are read EXPORT_BATCH_SIZE at a time through a streaming cursor and
+    written out as they arrive, so memory stays flat however long the history.
+    """
+    user_id = g.user_id
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    dumps = current_app.json.dumps
+
+    def records():
+        yield dumps({'type': 'export', 'version': EXPORT_FORMAT_VERSION,
+                     'exported_at': datetime.now(timezone.utc).isoformat()}) + '\n'
+        for kind, columns, model, to_dict in (('habit', HABIT_COLUMNS, Habit, habit_dict),
+                                              ('message', MESSAGE_COLUMNS, Message, message_dict)):
+            result = db.session.execute(select(*columns)
+                                        .where(model.user_id == user_id, model.deleted_at.is_(None))
+                                        .order_by(model.id)
+                                        .execution_options(yield_per=batch_size))
+            for rows in result.partitions():
+                yield ''.join(dumps({'type': kind, **to_dict(row)}) + '\n' for row in rows)
+        db.session.rollback()  # end the read transaction; the session outlives the generator
+
+    response = Response(stream_with_context(records()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename="habit_free_export.ndjson"'
+    return response
+
+def _import_habit(user_id, record):
+    name = record.get('name')
+    if not isinstance(name, str) or not name or len(name) > 100:
+        raise ValueError('Habit name required (at most 100 characters)')
+    start = datetime.fromisoformat(record['start_datetime']) if record.get('start_datetime') else None
+    if start and start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return {'user_id': user_id, 'name': name, 'start_datetime': start or datetime.now(timezone.utc)}
+
+def _import_message(user_id, record):
+    body = record.get('message')
+    if not isinstance(body, str) or not body or len(body) > 500:
+        raise ValueError('Message text required (at most 500 characters)')
+    return {'user_id': user_id, 'message': body, 'send_date': parse_send_date(str(record.get('send_date', ''))),
+            'is_masked': bool(record.get('is_masked', True))}
+
+def iter_lines(stream, max_line, chunk_size=64 * 1024):
+    """Yield the lines of a binary stream read in chunks; a line over `max_line` bytes yields None."""
+    buffer, overflow = b'', False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        for line in lines:
+            yield None if overflow or len(line) > max_line else line
+            overflow = False
+        if len(buffer) > max_line:
+            buffer, overflow = b'', True  # drop the partial line; report it when it ends
+    if overflow or buffer:
+        yield None if overflow or len(buffer) > max_line else buffer
+
+IMPORT_RECORDS = {
+    'habit': (Habit, _import_habit),
+    'message': (Message, _import_message),
+}
+
+@api.route('/import', methods=['POST'])
+@login_required
+def import_history():
+    """Add habits and messages from an NDJSON upload in the /export format.
+
+    The body is read line by line as it arrives and inserted in transactions
+    of IMPORT_BATCH_SIZE rows. Ids in the upload are ignored; rows get new ids.
+    Invalid lines are skipped and reported (the first 20) with their line numbers.
+    """
+    user_id = g.user_id
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    max_line = current_app.config['IMPORT_MAX_LINE']
+    pending = {kind: [] for kind in IMPORT_RECORDS}
+    imported = {kind: 0 for kind in IMPORT_RECORDS}
+    errors, error_count = [], 0
+
+    def flush():
+        for kind, rows in pending.items():
+            if rows:
+                db.session.execute(insert(IMPORT_RECORDS[kind][0]), rows)
+                imported[kind] += len(rows)
+        bump_data_version(user_id)
+        db.session.commit()
+        for rows in pending.values():
+            rows.clear()
+
+    try:
+        # request.stream reads byte by byte under readline(), so split chunks ourselves
+        for line_number, line in enumerate(iter_lines(request.stream, max_line), 1):
+            if line is not None and not line.strip():
+                continue
+            try:
+                if line is None:
+                    raise ValueError(f'Line longer than {max_line} bytes')
+                record = current_app.json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('Each line must be a JSON object')
+                if record.get('type') == 'export':
+                    continue
+                if record.get('type') not in IMPORT_RECORDS:
+                    raise ValueError(f"Unknown record type {record.get('type')!r}")
+                pending[record['type']].append(IMPORT_RECORDS[record['type']][1](user_id, record))
+            except (ValueError, TypeError, KeyError) as e:
+                error_count += 1
+                if len(errors) < 20:
+                    errors.append({'line': line_number, 'message': str(e)})
+                continue
+            if sum(len(rows) for rows in pending.values()) >= batch_size:
+                flush()
+        if any(pending.values()):
+            flush()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Import error: {str(e)}')
+        return jsonify({'success': False, 'message': str(e), 'habits': imported['habit'],
+                        'messages': imported['message']}), 500
+
+    return jsonify({
+        'success': True,
+        'message': f"Imported {imported['habit']} habits and {imported['message']} messages",
+        'habits': imported['habit'],
+        'messages': imported['message'],
+        'skipped': error_count,
+        'errors': errors
+    })
+
+@api.route('/sql_profile', methods=['GET'])
+def sql_profile():
+    """Recent SQL profiler reports, newest last; `?id=` selects the one named in an X-SQL-Profile header."""
+    if not current_app.config['SQL_PROFILER']:
+        return jsonify({'success': False, 'message': 'Resource not found'}), 404
+    token = current_app.config['SQL_PROFILER_TOKEN']
+    if token:
+        if not hmac.compare_digest(_request_token() or '', token):
+            return jsonify({'success': False, 'message': 'Invalid profiler token'}), 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'success': False, 'message': 'Profiler reports are only served locally'}), 403
+    reports = list(current_app.extensions['sql_profiles'])
+    report_id = request.args.get('id')
+    if report_id:
+        reports = [report for report in reports if report['id'] == report_id]
+        if not reports:
+            return jsonify({'success': False, 'message': 'Profile not found'}), 404
+    return jsonify({'success': True, 'profiles': reports})
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({'success': False, 'message': 'Resource not found'}), 404
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(_request_token() or '', token):
+        return jsonify({'success': False, 'message': 'Invalid metrics token'}), 401
+    return Response(metrics.render(pool_metrics(db.engine)), mimetype='text/plain; version=0.0.4')
+
+# error handlers
+@api.app_errorhandler(404)
 def not_found_error(error):
-    app.logger.error(f'404 Error: {error}')
+    current_app.logger.error(f'404 Error: {error}')
     return jsonify({'success': False, 'message': 'Resource not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
-    app.logger.error(f'500 Error: {error}')
+    current_app.logger.error(f'500 Error: {error}')
     return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
-@app.errorhandler(Exception)
+@api.app_errorhandler(Exception)
 def handle_exception(error):
-    app.logger.error(f'Unhandled Exception: {error}')
+    current_app.logger.error(f'Unhandled Exception: {error}')
     return jsonify({'success': False, 'message': str(error)}), 500
 
-#  main Execution
-if __name__ == "__main__":
-    # initialize the app
+# scheduler leader election: every process runs a scheduler, but only the one
+# holding the leader lock runs jobs, so N workers never deliver N times
+class FileLeaderLock:
+    """Leader lock for processes on one host: an exclusive flock on a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self):
+        if self._file:
+            return True
+        if fcntl is None:
+            return True  # no flock on this platform; assume a single process
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file  # held until this process exits
+        return True
+
+class AdvisoryLeaderLock:
+    """Leader lock for processes on any host: a PostgreSQL session advisory lock.
+
+    The lock lasts as long as the connection that took it. If that connection
+    drops, PostgreSQL releases the lock and another process can win it, so
+    every election checks pg_locks that this session still holds it.
+    """
+
+    def __init__(self, engine, key):
+        self.engine = engine
+        self.key = key
+        self._connection = None
+
+    def _still_held(self):
+        # a bigint advisory key shows in pg_locks as its high and low 32 bits
+        try:
+            held = self._connection.execute(text(
+                "SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid() "
+                "AND classid = :high AND objid = :low AND objsubid = 1 AND granted"
+            ), {'high': (self.key >> 32) & 0xFFFFFFFF, 'low': self.key & 0xFFFFFFFF}).first() is not None
+            self._connection.commit()
+            return held
+        except Exception:
+            return False
+
+    def try_acquire(self):
+        if self._connection:
+            if self._still_held():
+                return True
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+        try:
+            connection = self.engine.connect()
+        except Exception:
+            return False  # database unreachable; nobody can be sure of the lock, so don't lead
+        try:
+            if connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': self.key}).scalar():
+                connection.commit()
+                self._connection = connection  # lock lives as long as this connection
+                return True
+        except Exception:
+            pass
+        connection.close()
+        return False
+
+def leader_lock(app):
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            return AdvisoryLeaderLock(db.engine, app.config['SCHEDULER_LOCK_KEY'])
+    return FileLeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+
+def run_scheduled_job(app, name, job):
+    # scheduler threads have no app context of their own
+    started = time.perf_counter()
+    with app.app_context():
+        stats = job()
+    labels = (name,)
+    metrics.observe('habit_free_scheduler_job_duration_seconds', time.perf_counter() - started, labels)
+    metrics.inc('habit_free_scheduler_job_runs_total', labels + ('success' if stats else 'error',))
+
+def start_scheduler(app):
+    """Start this process's scheduler and join the leader election.
+
+    Every process retries the election every SCHEDULER_ELECTION_INTERVAL
+    seconds. The winner schedules the midnight delivery job, and the tombstone
+    purge half an hour later, and immediately runs a catch-up delivery; if it dies, its lock is released and another
+    process takes over at its next election. A leader that finds it no longer
+    holds the lock removes its jobs and stands for election again.
+    """
+    if not app.config['SCHEDULER_ENABLED']:
+        return None
+
+    scheduler = BackgroundScheduler(timezone=pytz.UTC)
+    lock = leader_lock(app)
+
+    def elect():
+        leading = scheduler.get_job(DELIVERY_JOB) is not None
+        if not lock.try_acquire():
+            if leading:
+                # the lock went with its connection and another process may hold it now
+                app.logger.warning(f'Process {os.getpid()} lost the scheduler leader lock; stepping down')
+                scheduler.remove_job(DELIVERY_JOB)
+                scheduler.remove_job(TOMBSTONE_PURGE_JOB)
+            return
+        if leading:
+            return
+        app.logger.info(f'Process {os.getpid()} is the scheduler leader')
+        # schedule the message checker to run daily at midnight
+        scheduler.add_job(
+            run_scheduled_job,
+            'cron',
+            args=[app, DELIVERY_JOB, check_and_send_messages],
+            id=DELIVERY_JOB,
+            hour=0,
+            minute=0,
+            coalesce=True,  # a backlog of missed runs collapses into one catch-up pass
+            misfire_grace_time=None
+        )
+        scheduler.add_job(run_scheduled_job, 'cron', args=[app, TOMBSTONE_PURGE_JOB, purge_tombstones],
+                          id=TOMBSTONE_PURGE_JOB, hour=0, minute=30, coalesce=True, misfire_grace_time=None)
+        run_scheduled_job(app, DELIVERY_JOB, check_and_send_messages)
+
+    scheduler.add_job(elect, 'interval', seconds=app.config['SCHEDULER_ELECTION_INTERVAL'],
+                      id='leader_election', next_run_time=datetime.now(timezone.utc))
+    scheduler.start()
+    app.extensions['scheduler'] = scheduler
+    return scheduler
+
+# initialize the database: create tables and run migrations
+def init_app(app):
     with app.app_context():
-        # create database tables if they don't exist
         db.create_all()
-        app.logger.info('Database initialized')
-        
-        # run first message check
-        check_and_send_messages()
+        migrate_schema()
+        current_app.logger.info('Database initialized')
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Create missing tables and indexes on the configured database."""
+    db.create_all()
+    migrate_schema()
+    print('Database schema is up to date')
+
+# logging: request threads only enqueue records; one listener thread per
+# process formats them as JSON and does the file/stderr I/O
+_LOG_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields are included as keys."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback in its own field instead of folding it into the message."""
+
+    def prepare(self, record):
+        # tracebacks and args can't cross to the listener thread reliably, so render them here
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_log_queue = None
+_log_listener = None
+_log_pid = None
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _log_listener
+    if _log_listener and _log_pid == os.getpid():
+        _log_listener.stop()
+    _log_listener = None
+
+def configure_logging(app):
+    """Attach the process-wide queue handler to `app.logger`, starting the listener once per process."""
+    global _log_queue, _log_listener, _log_pid
+    # a forked worker inherits the queue but not the listener thread, so it starts its own
+    if _log_listener is None or _log_pid != os.getpid():
+        handlers = [logging.StreamHandler()]
+        if app.config['LOG_FILE']:
+            os.makedirs(os.path.dirname(app.config['LOG_FILE']) or '.', exist_ok=True)
+            handlers.append(RotatingFileHandler(app.config['LOG_FILE'], maxBytes=app.config['LOG_MAX_BYTES'],
+                                                backupCount=app.config['LOG_BACKUP_COUNT'], delay=True))
+        for handler in handlers:
+            handler.setFormatter(JsonFormatter())
+        _log_queue = queue.SimpleQueue()
+        _log_listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        _log_pid = os.getpid()
+        atexit.register(stop_logging)
+
+    # every app built by create_app shares one logger; swap in the current queue
+    for handler in list(app.logger.handlers):
+        if handler is default_handler or isinstance(handler, QueueHandler):
+            app.logger.removeHandler(handler)
+    app.logger.addHandler(StructuredQueueHandler(_log_queue))
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.propagate = False
+
+# metrics: counters and histograms kept in this process and rendered in the
+# Prometheus text format by /metrics; each gunicorn worker reports its own
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+class Metrics:
+    """A minimal thread-safe registry of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}     # name -> (type, help, label names, buckets)
+        self._values = {}   # name -> {label values: float or [bucket counts..., sum, count]}
+
+    def counter(self, name, help, labels=()):
+        self._meta[name] = ('counter', help, labels, None)
+        self._values[name] = {}
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help, labels, buckets)
+        self._values[name] = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = self._meta[name][3]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._values[name].get(labels)
+            if series is None:
+                series = self._values[name][labels] = [0] * (len(buckets) + 2)
+            # only the first bucket that fits is counted; render() makes them cumulative
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, gauges=()):
+        """The text exposition format, plus `gauges` given as (name, help, value) tuples."""
+        lines = []
+        with self._lock:
+            snapshot = {name: dict((labels, list(value) if isinstance(value, list) else value)
+                                   for labels, value in series.items())
+                        for name, series in self._values.items()}
+        for name, (kind, help, label_names, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(snapshot[name].items()):
+                label_text = ','.join(f'{key}="{val}"' for key, val in zip(label_names, labels))
+                braced = f'{{{label_text}}}' if label_text else ''
+                if kind == 'counter':
+                    lines.append(f'{name}{braced} {value:g}')
+                    continue
+                prefix = label_text + ',' if label_text else ''
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value[-1]}')
+                lines.append(f'{name}_sum{braced} {value[-2]:.6f}')
+                lines.append(f'{name}_count{braced} {value[-1]}')
+        for name, help, value in gauges:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.counter('habit_free_http_requests_total', 'HTTP requests by route, method and status.',
+                ('route', 'method', 'status'))
+metrics.histogram('habit_free_http_request_duration_seconds', 'HTTP request latency by route.',
+                  ('route', 'method'))
+metrics.histogram('habit_free_http_request_db_queries', 'SQL statements executed per HTTP request.',
+                  ('route',), QUERY_COUNT_BUCKETS)
+metrics.histogram('habit_free_http_request_db_seconds', 'Time spent in SQL per HTTP request.', ('route',))
+metrics.counter('habit_free_db_queries_total', 'SQL statements executed, in and out of requests.')
+metrics.counter('habit_free_db_query_seconds_total', 'Time spent executing SQL statements.')
+metrics.histogram('habit_free_scheduler_job_duration_seconds', 'Scheduler job run time.', ('job',), JOB_BUCKETS)
+metrics.counter('habit_free_scheduler_job_runs_total', 'Scheduler job runs by outcome.', ('job', 'result'))
+metrics.counter('habit_free_messages_delivered_total', 'Messages delivered by check_and_send_messages.')
+
+def pool_metrics(engine):
+    """Connection pool gauges, for pools that track them (QueuePool does; SQLite memory pools don't)."""
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return []
+    return [
+        ('habit_free_db_pool_size', 'Connections the pool keeps open.', pool.size()),
+        ('habit_free_db_pool_checked_out', 'Connections currently in use.', pool.checkedout()),
+        ('habit_free_db_pool_checked_in', 'Idle connections in the pool.', pool.checkedin()),
+        ('habit_free_db_pool_overflow', 'Connections open beyond the pool size.', max(pool.overflow(), 0)),
+    ]
+
+def instrument_engine(engine):
+    """Count and time every statement; per-request totals go on `g`."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        metrics.inc('habit_free_db_queries_total')
+        metrics.inc('habit_free_db_query_seconds_total', value=elapsed)
+        if has_request_context() and 'db_queries' in g:
+            g.db_queries += 1
+            g.db_seconds += elapsed
+            if 'sql_profile' in g:
+                g.sql_profile.append((statement, parameters, elapsed))
+
+def init_metrics(app):
+    """Time every request and every SQL statement of `app`."""
+    with app.app_context():
+        instrument_engine(db.engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        # the rule ('/delete/<int:habit_id>'), not the path, keeps the label set bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.inc('habit_free_http_requests_total', (route, request.method, str(response.status_code)))
+        metrics.observe('habit_free_http_request_duration_seconds',
+                        time.perf_counter() - g.request_started, (route, request.method))
+        metrics.observe('habit_free_http_request_db_queries', g.db_queries, (route,))
+        metrics.observe('habit_free_http_request_db_seconds', g.db_seconds, (route,))
+        return response
+
+def profile_statements(statements, threshold):
+    """Summarize (statement, parameters, seconds) tuples; flag statements repeated
+    at least `threshold` times with different parameters as likely N+1 queries."""
+    groups = OrderedDict()
+    for statement, parameters, seconds in statements:
+        group = groups.setdefault(statement, {'statement': statement, 'count': 0, 'seconds': 0.0, 'params': set()})
+        group['count'] += 1
+        group['seconds'] += seconds
+        group['params'].add(repr(parameters))
+    summary = []
+    for group in groups.values():
+        distinct = len(group.pop('params'))
+        group['distinct_params'] = distinct
+        group['seconds'] = round(group['seconds'], 6)
+        group['n_plus_one'] = group['count'] >= threshold and distinct > 1
+        summary.append(group)
+    return {
+        'queries': len(statements),
+        'seconds': round(sum(seconds for _, _, seconds in statements), 6),
+        'n_plus_one': [group['statement'] for group in summary if group['n_plus_one']],
+        'statements': summary,
+    }
+
+def init_sql_profiler(app):
+    """Record every statement of each request when SQL_PROFILER is on."""
+    app.extensions['sql_profiles'] = deque(maxlen=app.config['SQL_PROFILER_HISTORY'])
+    if not app.config['SQL_PROFILER']:
+        return
+
+    @app.before_request
+    def start_sql_profile():
+        g.sql_profile = []
+
+    @app.after_request
+    def report_sql_profile(response):
+        if 'sql_profile' not in g or request.endpoint == 'api.sql_profile':
+            return response
+        report = profile_statements(g.sql_profile, app.config['SQL_PROFILER_N_PLUS_ONE'])
+        # the path alone: query strings can carry a session_cookie
+        report.update(id=uuid.uuid4().hex[:12], method=request.method, path=request.path,
+                      status=response.status_code)
+        app.extensions['sql_profiles'].append(report)
+        response.headers['X-SQL-Profile'] = (f"id={report['id']}; queries={report['queries']}; "
+                                             f"ms={report['seconds'] * 1000:.2f}; n_plus_one={len(report['n_plus_one'])}")
+        if report['n_plus_one']:
+            app.logger.warning(f"Possible N+1 queries in {request.method} {request.path}",
+                               extra={'sql_profile': report['id'], 'statements': report['n_plus_one']})
+        return response
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider with orjson doing the encoding and decoding.
+
+    Output matches the stdlib provider: keys stay sorted, and dates, UUIDs and
+    dataclasses still go through DefaultJSONProvider.default.
+    """
+
+    def _option(self):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        return option | orjson.OPT_SORT_KEYS if self.sort_keys else option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)  # indented output for debugging
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._option() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def configure_json(app):
+    choice = app.config['JSON_PROVIDER']
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson but orjson is not installed')
+    if choice in ('auto', 'orjson') and orjson is not None:
+        app.json = OrjsonProvider(app)
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html'}
+
+def compress_body(data, encoding, level):
+    """`data` compressed with 'br' or 'gzip' at `level`."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def choose_encoding(accept_encodings):
+    """The client's preferred encoding among those we support, or None for identity."""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered)
+
+def init_compression(app):
+    """Compress large JSON/text responses for clients that send Accept-Encoding.
+
+    A compressed response is a different representation, so its strong ETag
+    gets the encoding appended; not_modified() matches either form.
+    """
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')  # its ETag may name an encoding
+            return response
+        if (response.is_streamed or response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESSION_MIN_SIZE']:
+            return response
+        level = app.config['COMPRESSION_BROTLI_QUALITY' if encoding == 'br' else 'COMPRESSION_GZIP_LEVEL']
+        response.set_data(compress_body(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
+
+def create_app(config=None):
+    """Application factory. `config` overrides values read from the environment."""
+    app = Flask(__name__)
+    CORS(app)
+    # unset (or empty) falls back to a per-process key: fine for one dev server, but tokens
+    # die with the process; gunicorn.conf.py shares one key between its workers
+    app.secret_key = os.getenv('FLASK_SECRET_KEY') or os.urandom(24)
+
+    load_config(app)
+    if config:
+        app.config.update(config)
+        if 'SQLALCHEMY_DATABASE_URI' in config and 'SQLALCHEMY_ENGINE_OPTIONS' not in config:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config['SQLALCHEMY_DATABASE_URI'])
+
+    configure_logging(app)
+    configure_json(app)
+    app.logger.info('Habit Free startup')
+
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite' and app.config['SQLITE_PRAGMAS']:
+            apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+    init_metrics(app)
+    init_sql_profiler(app)
+    init_compression(app)
+    app.register_blueprint(api)
+    app.cli.add_command(migrate_command)
+    return app
+
+#  main Execution (development server; production runs wsgi:app under gunicorn)
+if __name__ == "__main__":
+    app = create_app()
+    # create database tables if they don't exist
+    init_app(app)
+    # the scheduler leader runs the first message check
+    start_scheduler(app)
     
     # run the flask app
     print("Starting Flask server on http://0.0.0.0:5002")
-    app.run(debug=True, host='0.0.0.0', port=5002, use_reloader=False)
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG', 'true').lower() == 'true', host='0.0.0.0', port=5002, use_reloader=False)
@@ -15,6 +15,7 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.gridlayout import GridLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.screenmanager import ScreenManager, Screen, FadeTransition
 from kivy.uix.spinner import Spinner
 from kivy.uix.popup import Popup
@@ -28,8 +29,11 @@ from kivy.graphics import Color, Rectangle, Line, RoundedRectangle
 from kivy.core.window import Window
 from kivy.storage.jsonstore import JsonStore
 
+from client_cache import LocalCache
+
 import datetime
 import calendar
+import gzip
 import json
 import pytz
 import random
@@ -37,10 +41,45 @@ import re
 import requests
 from urllib.parse import urlencode
 import time
+try:
+    import brotli
+except ImportError:  # optional: without it the client only asks for gzip
+    brotli = None
 
 BASE_URL = "http://127.0.0.1:5002"  
+BATCH_FLUSH_DELAY = 0.15  # seconds to gather queued mutations into one /batch request
+OUTBOX_BATCH_SIZE = 100  # most outbox operations per /batch request (the server's BATCH_MAX_OPERATIONS)
+OUTBOX_RETRY_MIN, OUTBOX_RETRY_MAX = 2, 60  # seconds between outbox retries while the server is unreachable
+OUTBOX_MAX_ATTEMPTS = 5  # server errors before an operation is sent alone, and again before it is dropped
+SYNC_INTERVAL = 60  # seconds between background syncs
+SESSION_EXPIRED_MESSAGE = "Your session has expired. Please log in again."
+ACCEPT_ENCODING = 'br, gzip' if brotli is not None else 'gzip'
+EYE_OPEN_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'open_eye.PNG')
+EYE_CLOSED_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'closed_eye.PNG')
 utc = pytz.utc
 
+
+class ApiRequest(UrlRequest):
+    """UrlRequest that asks for a compressed response and inflates it before JSON decoding."""
+
+    def __init__(self, url, **kwargs):
+        kwargs['req_headers'] = dict(kwargs.get('req_headers') or {}, **{'Accept-Encoding': ACCEPT_ENCODING})
+        super().__init__(url, **kwargs)
+
+    def decode_result(self, result, resp):
+        # the 'requests' network implementation inflates bodies itself, so only
+        # decompress what still looks compressed
+        encoding = next((value for key, value in self.get_all_headers(resp)
+                         if key.lower() == 'content-encoding'), '').strip().lower()
+        if isinstance(result, bytes) and encoding == 'gzip' and result[:2] == b'\x1f\x8b':
+            result = gzip.decompress(result)
+        elif isinstance(result, bytes) and encoding == 'br' and brotli is not None:
+            try:
+                result = brotli.decompress(result)
+            except brotli.error:
+                pass
+        return super().decode_result(result, resp)
+
 # theme colors
 light_theme = {
     "background": get_color_from_hex("#F5F5F5"),  # Light gray background
@@ -69,70 +108,158 @@ PREDEFINED_HABITS = {
     "Junk Food": "Avoiding junk food helps maintain a healthy weight, provides better nutrition, increases energy levels, and lowers risks of chronic diseases like heart disease and diabetes."
 }
 
-# custom widgets
-class HabitItem(BoxLayout):
+def is_session_token(value):
+    """Whether `value` has the shape of a server-signed token (payload.timestamp.signature)."""
+    return isinstance(value, str) and len(value.split('.')) >= 3
+
+def parse_start_time(value):
+    """Epoch seconds of an ISO start_datetime from the backend (naive values are UTC)."""
+    start_time = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if start_time.tzinfo is None:
+        start_time = pytz.utc.localize(start_time)
+    return start_time.timestamp()
+
+
+def format_elapsed(seconds):
+    """'3 Days 4 Hours 5 Minutes' style text for an elapsed time in seconds."""
+    minutes = max(int(seconds), 0) // 60
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days > 0:
+        return f"{days} Days {hours} Hours {minutes} Minutes"
+    if hours > 0:
+        return f"{hours} Hours {minutes} Minutes"
+    return f"{minutes} Minutes"
+
+
+class ElapsedTimeTicker:
+    """One clock event driving the elapsed-time label of every habit item in the tree.
+
+    Items register while they have a parent. The ticker sleeps until the next moment
+    any registered item's displayed minute rolls over, updates just those items, and
+    unschedules itself when nothing is registered.
+    """
+
+    def __init__(self):
+        self.items = set()
+        self.event = None
+
+    def register(self, item):
+        self.items.add(item)
+        self.update(item, time.time())
+        self.reschedule()
+
+    def unregister(self, item):
+        self.items.discard(item)
+        if not self.items and self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+    def update(self, item, now):
+        text = format_elapsed(now - item.start_time)
+        if text != item.elapsed_time_str:
+            item.elapsed_time_str = text
+
+    def next_change(self, now):
+        """Seconds until the soonest displayed minute changes."""
+        return min(60 - (now - item.start_time) % 60 for item in self.items)
+
+    def reschedule(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+        if self.items:
+            # a little past the boundary so the new minute has surely started
+            self.event = Clock.schedule_once(self.tick, self.next_change(time.time()) + 0.05)
+
+    def tick(self, dt):
+        self.event = None
+        now = time.time()
+        for item in self.items:
+            self.update(item, now)
+        self.reschedule()
+
+
+def habit_view_data(habit):
+    """RecycleView data row for a habit from the API."""
+    return {'habit_id': habit['id'], 'habit_name': habit['name'], 'start_datetime_str': habit['start_datetime']}
+
+
+def message_view_data(message):
+    """RecycleView data row for a message from the API."""
+    return {'message_id': message['id'], 'message_text': message['message'],
+            'send_date_str': f"Send on: {message['send_date']}", 'is_masked': message.get('is_masked', True)}
+
+
+class KeyedRows:
+    """Keyed reconciliation of a RecycleView's data list.
+
+    Every change is an item-level insert, delete or assignment on the data
+    ObservableList, which the RecycleView turns into a refresh of just the
+    affected rows; assigning a whole new list would re-bind every visible view.
+    """
+
+    def __init__(self, view, key):
+        self.view = view
+        self.key = key
+
+    def reconcile(self, rows):
+        """Make the data equal rows, touching only the rows that were added, removed, moved or changed."""
+        data = self.view.data
+        wanted = {row[self.key] for row in rows}
+        for index in range(len(data) - 1, -1, -1):  # from the end, so indices stay valid
+            if data[index][self.key] not in wanted:
+                del data[index]
+        for index, row in enumerate(rows):
+            if index < len(data) and data[index][self.key] == row[self.key]:
+                if data[index] != row:
+                    data[index] = row
+                continue
+            moved = next((i for i in range(index + 1, len(data)) if data[i][self.key] == row[self.key]), None)
+            if moved is not None:
+                del data[moved]
+            data.insert(index, row)
+
+
+# custom widgets; both are RecycleView rows, reused for whichever data row scrolls into view
+class HabitItem(RecycleDataViewBehavior, BoxLayout):
     habit_id = NumericProperty(0)
     habit_name = StringProperty("")
     start_datetime_str = StringProperty("")
-    elapsed_time_str = StringProperty("0d 0h 0m")
+    elapsed_time_str = StringProperty("0 Minutes")
     is_predefined = BooleanProperty(False)
     background_color = ObjectProperty(get_color_from_hex("#FFFFFF"))
 
-    def __init__(self, habit_data, **kwargs):
+    def __init__(self, **kwargs):
+        self.start_time = time.time()
         super().__init__(**kwargs)
         self.app = App.get_running_app()
-        self.habit_id = habit_data['id']
-        self.habit_name = habit_data['name']
-        self.start_datetime_str = habit_data['start_datetime']
-        self.is_predefined = self.habit_name in PREDEFINED_HABITS
-        
-        # start the timer with 1 second interval 
-        Clock.schedule_interval(self.update_elapsed_time, 1)
-        self.update_elapsed_time(0)
-        
         Clock.schedule_once(self.apply_theme, 0)
 
-    def update_elapsed_time(self, dt):
+    def refresh_view_attrs(self, rv, index, data):
+        super().refresh_view_attrs(rv, index, data)
+        self.apply_theme()
+
+    def on_habit_name(self, instance, value):
+        self.is_predefined = value in PREDEFINED_HABITS
+
+    def on_start_datetime_str(self, instance, value):
         try:
-            # parse the UTC time from the backend
-            start_time = datetime.datetime.fromisoformat(self.start_datetime_str.replace('Z', '+00:00'))
-            if start_time.tzinfo is None:
-                start_time = pytz.utc.localize(start_time)
-            
-            # get current time in UTC
-            now = datetime.datetime.now(pytz.utc)
-            
-            # calculate the time difference in UTC
-            delta = now - start_time
-            
-            # extract days, hours, and minutes
-            days = delta.days
-            total_seconds = delta.seconds
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            
-            # format the elapsed time string
-            if days > 0:
-                new_time_str = f"{days}d {hours}h {minutes}m"
-            elif hours > 0:
-                new_time_str = f"{hours}h {minutes}m"
-            else:
-                new_time_str = f"{minutes}m"
-            
-            # Only update if the time string has changed
-            if new_time_str != self.elapsed_time_str:
-                self.elapsed_time_str = new_time_str
-                # Force UI update
-                if hasattr(self, 'ids') and 'elapsed_time_label' in self.ids:
-                    self.ids.elapsed_time_label.text = self.elapsed_time_str.replace('d', ' Days ').replace('h', ' Hours ').replace('m', ' Minutes')
-            
-            # print debug information every minute
-            if minutes % 1 == 0 and total_seconds % 60 == 0:
-                print(f"Time update - Start: {start_time}, Now: {now}, Delta: {delta}, Display: {self.elapsed_time_str}")
-            
-        except Exception as e:
-            print(f"Error updating elapsed time: {e}")
-            self.elapsed_time_str = "Error"
+            self.start_time = parse_start_time(value)
+        except ValueError as e:
+            print(f"Error parsing habit start time {value!r}: {e}")
+            self.start_time = time.time()
+        if self.parent is not None and self.app:
+            self.app.elapsed_ticker.register(self)  # re-times the label for the new start
+
+    def on_parent(self, instance, parent):
+        # the shared ticker only drives items that are on screen
+        if not self.app:
+            return
+        if parent is None:
+            self.app.elapsed_ticker.unregister(self)
+        else:
+            self.app.elapsed_ticker.register(self)
 
     def apply_theme(self, *args):
         if not self.app: return
@@ -221,34 +348,25 @@ class HabitItem(BoxLayout):
                 popup.open()
 
 
-class MessageItem(BoxLayout):
+class MessageItem(RecycleDataViewBehavior, BoxLayout):
     message_id = NumericProperty(0)
     message_text = StringProperty("")
     send_date_str = StringProperty("")
     is_masked = BooleanProperty(True)
     masked_text = StringProperty("********")
     background_color = ObjectProperty(get_color_from_hex("#FFFFFF"))
-    eye_open_source = StringProperty('')
-    eye_closed_source = StringProperty('')
+    eye_open_source = StringProperty(EYE_OPEN_SOURCE)
+    eye_closed_source = StringProperty(EYE_CLOSED_SOURCE)
 
-    def __init__(self, message_data, **kwargs):
+    def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.app = App.get_running_app()
-        self.message_id = message_data['id']
-        self.message_text = message_data['message']
-        self.send_date_str = f"Send on: {message_data['send_date']}"
-        self.is_masked = message_data.get('is_masked', True)
-        self.masked_text = "*" * min(len(self.message_text), 20)  # cap at 20 asterisks
-        
-        # set the image paths
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        self.eye_open_source = os.path.join(current_dir, 'open_eye.PNG')
-        self.eye_closed_source = os.path.join(current_dir, 'closed_eye.PNG')
-        
         Clock.schedule_once(self.apply_theme, 0)
         Clock.schedule_once(self.update_toggle_button, 0)
 
+    def on_message_text(self, instance, value):
+        self.masked_text = "*" * min(len(value), 20)  # cap at 20 asterisks
+
     def update_toggle_button(self, dt):
         """Update the toggle button appearance based on masked state"""
         if hasattr(self, 'ids') and 'toggle_mask_button' in self.ids:
@@ -261,36 +379,16 @@ class MessageItem(BoxLayout):
         Clock.schedule_once(self.update_toggle_button, 0)
 
     def toggle_mask(self):
-        """Toggle message masking and update server."""
-        url = f"{self.app.base_url}/toggle_message_mask/{self.message_id}?user_id={self.app.user_id}"
-        headers = {'Content-Type': 'application/json'}
-        
-        try:
-            UrlRequest(
-                url,
-                method='POST',
-                req_headers=headers,
-                on_success=self.on_toggle_success,
-                on_failure=self.on_toggle_failure,
-                on_error=self.on_toggle_error
-            )
-        except Exception as e:
-            print(f"Failed to send toggle request: {e}")
-
-    def on_toggle_success(self, request, result):
-        """Handle successful mask toggle."""
-        message_data = result.get('message_data', {})
-        self.is_masked = message_data.get('is_masked', self.is_masked)
-        self.update_toggle_button(0)  # update button appearance immediately
+        """Flip the mask; the outbox applies it locally right away and replays it to the server."""
+        self.app.operations.enqueue(
+            {'op': 'toggle_message_mask', 'id': self.message_id, 'is_masked': not self.is_masked},
+            on_result=lambda res: None if res.get('success') else self.on_toggle_failure(None, res)
+        )
 
     def on_toggle_failure(self, request, result):
-        """Handle toggle failure."""
+        """Handle toggle failure; the next sync restores the server's state."""
         print(f"Failed to toggle message mask: {result}")
 
-    def on_toggle_error(self, request, error):
-        """Handle toggle error."""
-        print(f"Error toggling message mask: {error}")
-
     def apply_theme(self, *args):
         if not self.app: return
         colors = self.app.theme_colors
@@ -454,115 +552,57 @@ class BaseScreen(Screen):
 
 # dashboard screen
 class DashboardScreen(BaseScreen):
-    last_fetch_time = NumericProperty(0)
-    habits_data = ListProperty([])
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.habits_grid = None
+        self.habits_view = None
+        self.habit_rows = None
         Clock.schedule_once(self._init_grid, 0)
 
     def _init_grid(self, dt):
-        if hasattr(self.ids, 'habit_list'):
-            self.habits_grid = self.ids.habit_list
-            print("Habits grid initialized")
-
-    def on_enter(self, *args):
-        """Called when screen is entered"""
-        super().on_enter(*args)
-        if self.app and self.app.user_id:
-            self.fetch_data()
+        if hasattr(self.ids, 'habit_scroll'):
+            self.habits_view = self.ids.habit_scroll
+            self.habit_rows = KeyedRows(self.habits_view, 'habit_id')
+            print("Habits list initialized")
 
     def fetch_data(self, *args):
-        """Fetch habits data from the server."""
+        """Show the cached habits at once, then sync with the server in the background."""
         if not self.app or not self.app.user_id:
             self.update_status("Not logged in", is_error=True)
             return
-            
-        current_time = time.time()
-        if current_time - self.last_fetch_time < 1:  # prevent rapid refetching
-            return
-            
-        self.last_fetch_time = current_time
-        url = f"{self.app.base_url}/get_habits?user_id={self.app.user_id}"
-        
-        try:
-            UrlRequest(
-                url,
-                on_success=self.handle_fetch_success,
-                on_failure=self.on_network_failure,
-                on_error=self.on_network_error,
-                req_headers={'Content-Type': 'application/json'}
-            )
-        except Exception as e:
-            self.update_status(f"Network error: {str(e)}", is_error=True)
-            print(f"Error fetching habits: {str(e)}")
-
-    def handle_fetch_success(self, request, result):
-        """Handle successful habits fetch"""
-        print(f"Fetch success response: {result}")
-        if isinstance(result, dict) and result.get('success'):
-            self.habits_data = result.get('habits', [])
-            print(f"Fetched {len(self.habits_data)} habits")
-            self.update_habits_grid()
-            self.update_status("", False)  # clear any error messages
-        else:
-            error_msg = result.get('message', 'No habits found or invalid response')
-            self.update_status(error_msg, is_error=True)
+        self.show_cached()
+        self.app.sync.request()
 
-    def update_habits_grid(self):
-        """Update the habits grid with fetched data"""
-        if not self.habits_grid:
-            print("Error: habits_grid not initialized")
+    def show_cached(self):
+        """Reconcile the habits list with the local cache; only changed rows are touched"""
+        if not self.habit_rows or not self.app.user_id:
             return
-            
-        self.habits_grid.clear_widgets()
-        print(f"Updating habits grid with {len(self.habits_data)} habits")
-        
-        if not self.habits_data:
-            print("No habits to display")
+        habits = self.app.cache.habits(self.app.user_id)
+        self.habit_rows.reconcile([habit_view_data(habit) for habit in habits])
+        if not habits:
             self.update_status("No habits found")
-            return
-            
-        for habit in self.habits_data:
-            print(f"Adding habit to grid: {habit}")
-            habit_item = Factory.HabitItem(habit_data=habit)
-            self.habits_grid.add_widget(habit_item)
-            print(f"Added habit {habit['name']} to grid")
+        elif self.status_message == "No habits found":
+            self.update_status("", False)
 
     def show_random_fact(self):
         if hasattr(self, 'ids') and 'habit_fact_label' in self.ids:
             fact = random.choice(self.habit_facts)
             self.ids.habit_fact_label.text = fact
 
-    def update_elapsed_times(self, dt):
-        pass # HabitItem internal timer handles this
-
     def delete_habit(self, habit_id):
         if not self.app.user_id:
             self.update_status("Error: No user session", True)
             return
 
-        self.update_status("Deleting habit...", False)
-        url = f"{self.base_url}/delete/{habit_id}?user_id={self.app.user_id}"
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        print(f"Sending delete request for ID {habit_id} to {url}")
-        try:
-            UrlRequest(url, method='DELETE',
-                      req_headers=headers,
-                      on_success=lambda req, res: self.handle_network_response(req, res, self.on_delete_success, "Delete failed"),
-                      on_failure=self.on_network_failure,
-                      on_error=self.on_network_error,
-                      timeout=10)
-        except Exception as e:
-             self.update_status(f"Failed to send delete request: {e}", True)
-             self.show_popup("Error", f"Failed to delete habit: {e}")
+        print(f"Queueing delete for habit ID {habit_id}")
+        self.app.operations.enqueue(
+            {'op': 'delete_habit', 'id': habit_id},
+            on_result=lambda res: self.handle_network_response(None, res, self.on_delete_success, "Delete failed")
+        )
+        self.update_status("Habit deleted.", False)
 
     def on_delete_success(self, result):
-        self.update_status("Habit deleted.", False)
-        self.fetch_data()
+        print(f"Server confirmed delete: {result.get('message')}")
 
     def go_to_add_habit(self, *args):
         print("Navigating to Add Habit")
@@ -646,43 +686,20 @@ class AddHabitScreen(BaseScreen):
             self.update_status("Please enter a habit name", True)
             return
 
-        self.update_status("Adding habit...", False)
-        url = f"{self.base_url}/add"
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        # include user_id in form data instead of headers
-        req_body = urlencode({
-            'name': habit_name,
-            'user_id': str(self.app.user_id)
-        })
-        
-        print(f"Attempting to add habit: {habit_name}")
-        try:
-            UrlRequest(url,
-                      method='POST',
-                      req_headers=headers,
-                      req_body=req_body,
-                      on_success=lambda req, res: self.handle_network_response(req, res, self.on_add_success, "Failed to add habit"),
-                      on_failure=self.on_network_failure,
-                      on_error=self.on_network_error,
-                      timeout=10)
-        except Exception as e:
-            self.update_status(f"Failed to send add request: {e}", True)
-            self.show_popup("Error", f"Failed to add habit: {e}")
+        print(f"Queueing habit: {habit_name}")
+        # the outbox shows the habit right away and sends it when the server is reachable
+        self.app.operations.enqueue(
+            {'op': 'add_habit', 'name': habit_name},
+            on_result=lambda res: self.handle_network_response(None, res, self.on_add_success, "Failed to add habit")
+        )
+        self.update_status("Habit added successfully!", False)
+        self.ids.add_habit_input.text = ""
+        self.ids.predefined_spinner.text = "Select Habit"
+        Clock.schedule_once(self.go_to_dashboard, 0.5)
 
     def on_add_success(self, result):
-        """Handle successful habit addition."""
+        """Handle the server's confirmation of a queued habit."""
         print(f"Add habit response: {result}")
-        if result.get('habit'):
-            self.update_status("Habit added successfully!", False)
-            self.ids.add_habit_input.text = ""
-            self.ids.predefined_spinner.text = "Select Habit"
-            Clock.schedule_once(self.go_to_dashboard, 0.5)
-        else:
-            error_msg = result.get('message', 'Unknown error occurred')
-            self.update_status(f"Error: {error_msg}", True)
 
     def go_to_dashboard(self, *args):
         self.manager.transition = FadeTransition(duration=0.2); self.manager.current = 'dashboard'
@@ -695,8 +712,14 @@ class InboxScreen(BaseScreen):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs); self.update_year_spinner()
+        self.message_rows = None
+        Clock.schedule_once(self._init_list, 0)
         Clock.schedule_once(self._bind_spinners, 0.1)
 
+    def _init_list(self, dt):
+        if 'messages_scroll' in self.ids:
+            self.message_rows = KeyedRows(self.ids.messages_scroll, 'message_id')
+
     def _bind_spinners(self, dt):
          if hasattr(self, 'ids'):
              if 'month_spinner' in self.ids: self.ids.month_spinner.bind(text=self.update_day_spinner)
@@ -728,37 +751,20 @@ class InboxScreen(BaseScreen):
         if 'save_button' in self.ids: self.ids.save_button.background_color = colors.get('primary'); self.ids.save_button.color = colors.get('primary_text')
         if 'back_button' in self.ids: self.ids.back_button.background_color = colors.get('secondary'); self.ids.back_button.color = colors.get('secondary_text')
         if 'messages_grid' in self.ids:
-            for item in self.ids.messages_grid.children:
+            for item in self.ids.messages_grid.children:  # the visible rows; recycled ones keep their theme
                 if isinstance(item, MessageItem): item.apply_theme()
-                elif isinstance(item, Label): item.color = colors.get('secondary_text')
 
     def on_enter(self, *args):
         super().on_enter(*args); self.set_default_date()
         self.fetch_data()
 
     def fetch_data(self, *args):
-        """Fetch messages for the inbox."""
+        """Show the cached messages at once, then sync with the server in the background."""
         if not self.app.user_id:
             self.update_status("Error: No user session", True)
             return
-
-        self.update_status("Loading messages...", False)
-        url = f"{self.base_url}/get_messages?user_id={self.app.user_id}"
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        print(f"Attempting to fetch messages from: {url}")
-        
-        try:
-            UrlRequest(url,
-                      req_headers=headers,
-                      on_success=lambda req, res: self.handle_network_response(req, res, self.parse_messages_success, "Failed to parse messages"),
-                      on_failure=self.on_network_failure,
-                      on_error=self.on_network_error,
-                      timeout=10)
-        except Exception as e:
-            self.update_status(f"Failed to initiate message fetch: {e}", True)
-            self.show_popup("Error", f"Failed to request messages: {e}")
+        self.show_cached()
+        self.app.sync.request()
 
     def set_default_date(self):
         today = datetime.date.today()
@@ -771,34 +777,16 @@ class InboxScreen(BaseScreen):
              if day_to_set not in self.day_values: day_to_set = "Day"
              if 'day_spinner' in self.ids: self.ids.day_spinner.text = day_to_set
 
-    def parse_messages_success(self, result):
-        """Process successful message fetch response."""
-        print("Messages fetched successfully.")
-        if not hasattr(self, 'ids') or 'messages_grid' not in self.ids:
-            print("UI Error")
+    def show_cached(self):
+        """Reconcile the inbox with the local cache; only changed rows are touched."""
+        if not self.message_rows or not self.app.user_id:
             return
-        
-        messages_grid = self.ids.messages_grid
-        messages_grid.clear_widgets()
-        self.update_status("", False)
-        
-        try:
-            messages = result.get('messages', [])
-            if not messages:
-                messages_grid.add_widget(Label(
-                    text="No messages saved yet.",
-                    color=self.app.theme_colors.get('secondary_text', (0.5, 0.5, 0.5, 1))
-                ))
-                return
-                
-            for msg_data in messages:
-                item = Factory.MessageItem(message_data=msg_data)
-                messages_grid.add_widget(item)
-                
-        except Exception as e:
-            print(f"Error populating messages grid: {e}")
-            self.update_status(f"Error displaying messages: {e}", True)
-            
+        messages = self.app.cache.messages(self.app.user_id)
+        self.message_rows.reconcile([message_view_data(message) for message in messages])
+        if not messages:
+            self.update_status("No messages saved yet.", False)
+        elif self.status_message == "No messages saved yet.":
+            self.update_status("", False)
         self.apply_theme_widgets()
 
     def save_message(self, *args):
@@ -838,38 +826,17 @@ class InboxScreen(BaseScreen):
             self.show_popup("Input Error", f"Date error: {e}")
             return
 
-        self.update_status("Saving message...", False)
-        url = f"{self.base_url}/inbox"
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        # include user_id in form data
-        req_body = urlencode({
-            'message': message,
-            'date': date_str,
-            'user_id': str(self.app.user_id)
-        })
-        
-        print(f"Sending save message request to {url} with data: {req_body}")
-
-        try:
-            UrlRequest(url,
-                      method='POST',
-                      req_headers=headers,
-                      req_body=req_body,
-                      on_success=lambda req, res: self.handle_network_response(req, res, self.on_save_success, "Save failed"),
-                      on_failure=self.on_network_failure,
-                      on_error=self.on_network_error,
-                      timeout=10)
-        except Exception as e:
-            self.update_status(f"Failed to send save request: {e}", True)
-            self.show_popup("Error", f"Failed to save message: {e}")
+        print(f"Queueing message for {date_str}")
+        self.app.operations.enqueue(
+            {'op': 'save_message', 'message': message, 'date': date_str},
+            on_result=lambda res: self.handle_network_response(None, res, self.on_save_success, "Save failed")
+        )
+        self.update_status("Message saved!", False); self.ids.message_input.text = ""
 
     def on_save_success(self, result):
         message = result.get('message', 'Message saved!'); error = result.get('error')
         if error: self.update_status(f"Error: {error}", True); self.show_popup("Save Error", error)
-        else: self.update_status(message, False); self.ids.message_input.text = ""; self.fetch_data()
+        else: print(f"Server confirmed message: {message}")
 
     def delete_message(self, message_id):
         """Delete a message."""
@@ -877,27 +844,15 @@ class InboxScreen(BaseScreen):
             self.update_status("Error: No user session", True)
             return
 
-        self.update_status("Deleting message...", False)
-        url = f"{self.base_url}/delete_message/{message_id}?user_id={self.app.user_id}"
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        print(f"Sending delete message request for ID {message_id} to {url}")
-        
-        try:
-            UrlRequest(url,
-                      method='DELETE',
-                      req_headers=headers,
-                      on_success=lambda req, res: self.handle_network_response(req, res, self.on_delete_message_success, "Delete failed"),
-                      on_failure=self.on_network_failure,
-                      on_error=self.on_network_error,
-                      timeout=10)
-        except Exception as e:
-            self.update_status(f"Failed to send delete request: {e}", True)
-            self.show_popup("Error", f"Failed to delete message: {e}")
+        print(f"Queueing delete for message ID {message_id}")
+        self.app.operations.enqueue(
+            {'op': 'delete_message', 'id': message_id},
+            on_result=lambda res: self.handle_network_response(None, res, self.on_delete_message_success, "Delete failed")
+        )
+        self.update_status("Message deleted.", False)
 
     def on_delete_message_success(self, result):
-        self.update_status("Message deleted.", False); self.fetch_data()
+        print(f"Server confirmed delete: {result.get('message')}")
 
     def go_to_dashboard(self, *args):
         self.manager.transition = FadeTransition(duration=0.2); self.manager.current = 'dashboard'
@@ -934,17 +889,8 @@ class ProfileScreen(BaseScreen):
         print("Logging out user...")
         app = App.get_running_app()
         
-        # Clear the stored credentials
-        if app.store:
-            app.store.delete('session')
-        
-        # clear the app's username and session data
-        app.username = None
-        app.user_id = None
-        app.session_cookie = None
-        
-        # navigate to login screen
-        self.manager.current = 'login'
+        # clear the stored credentials and go back to the login screen
+        app.end_session()
 
     def go_to_dashboard(self, *args):
         """Navigate back to the dashboard"""
@@ -1058,7 +1004,7 @@ class LoginScreen(BaseScreen):
         print(f"Sending login request to {url} with data: {req_body}")
 
         try:
-            UrlRequest(url, method='POST',
+            ApiRequest(url, method='POST',
                       req_body=req_body,
                       req_headers={'Content-Type': 'application/x-www-form-urlencoded'},
                       on_success=lambda req, res: self.handle_network_response(req, res, self.on_login_success, "Login failed"),
@@ -1159,8 +1105,7 @@ class LoginScreen(BaseScreen):
                 )
                 def after_close(instance):
                     # Optionally, delete the message from the server so it doesn't show again
-                    url = f"{self.app.base_url}/delete_message/{msg['id']}?user_id={self.app.user_id}"
-                    UrlRequest(url, method='DELETE')
+                    self.app.operations.enqueue({'op': 'delete_message', 'id': msg['id']})
                     # If there are more messages, show the next one
                     if len(messages) > 1:
                         show_scheduled_popup(messages[1:])
@@ -1248,7 +1193,7 @@ class RegisterScreen(BaseScreen):
         print(f"Sending registration request to {url} with data: {req_body}")
 
         try:
-            UrlRequest(url, method='POST',
+            ApiRequest(url, method='POST',
                       req_body=req_body,
                       req_headers={'Content-Type': 'application/x-www-form-urlencoded'},
                       on_success=lambda req, res: self.handle_network_response(req, res, self.on_register_success, "Registration failed"),
@@ -1326,15 +1271,257 @@ class MessageScreen(BaseScreen):
         self.manager.transition = FadeTransition(duration=0.2)
         self.manager.current = 'inbox'
 
+# --- Operation Queue ---
+class OperationQueue:
+    """Durable outbox of habit/message mutations, replayed through /batch.
+
+    enqueue() stores an operation in the local cache's outbox and applies it to
+    the cached rows, so the lists show it at once. Operations queued within
+    BATCH_FLUSH_DELAY of each other go out as one request and one server-side
+    commit. Anything the server hasn't answered -- the app was offline, or
+    closed -- is sent by a later flush, oldest first, retrying with backoff.
+    Operations in batches the server keeps failing (5xx) are retried one at a
+    time after OUTBOX_MAX_ATTEMPTS errors, so a single poisoned operation is
+    found and dropped, with its error shown, instead of blocking the outbox.
+    Each operation's callback receives its own result dict, shaped like the
+    matching single-operation endpoint, if it was queued in this run.
+    """
+
+    def __init__(self, app, delay=BATCH_FLUSH_DELAY):
+        self.app = app
+        self.delay = delay
+        self.callbacks = {}  # outbox seq -> on_result
+        self.in_flight = False
+        self.retry_delay = OUTBOX_RETRY_MIN
+        self.attempts = {}  # outbox seq -> server errors so far, this run
+        self._flush_event = None
+
+    def enqueue(self, operation, on_result=None):
+        """Queue an operation such as {'op': 'delete_habit', 'id': 3}."""
+        queued = self.app.cache.enqueue(self.app.user_id, operation)
+        if on_result:
+            self.callbacks[queued['seq']] = on_result
+        self.app.refresh_lists()
+        self.schedule(self.delay)
+
+    def schedule(self, delay):
+        if self._flush_event is None:
+            self._flush_event = Clock.schedule_once(self.flush, delay)
+
+    def flush(self, *args):
+        """Send the oldest queued operations as one /batch request."""
+        self._flush_event = None
+        user_id = self.app.user_id
+        if self.in_flight or not user_id or not self.app.session_cookie:
+            return
+        batch = []
+        for seq, operation in self.app.cache.pending(user_id, OUTBOX_BATCH_SIZE):
+            if operation.get('id', 0) < 0:
+                break  # targets a row created offline; wait for the server to assign its id
+            if batch and self.attempts.get(batch[0][0], 0) >= OUTBOX_MAX_ATTEMPTS:
+                break  # the server keeps failing on this batch; send the oldest alone to isolate the culprit
+            batch.append((seq, operation))
+        if not batch:
+            return
+
+        url = f"{self.app.base_url}/batch"
+        print(f"Sending batch of {len(batch)} operations to {url}")
+        self.in_flight = True
+        try:
+            ApiRequest(url,
+                      method='POST',
+                      req_headers=self.app.auth_headers(),
+                      req_body=json.dumps({'operations': [operation for _, operation in batch]}),
+                      on_success=lambda req, res: self._dispatch(user_id, batch, req, res),
+                      on_failure=lambda req, res: self._dispatch(user_id, batch, req, res),
+                      on_error=lambda req, error: self._retry(error),
+                      timeout=10)
+        except Exception as e:
+            self._retry(e)
+
+    def _dispatch(self, user_id, batch, request, result):
+        self.in_flight = False
+        results = result.get('results') if isinstance(result, dict) else None
+        if not results:
+            status = request.resp_status if request else None
+            if status == 401:
+                # the session expired; the operations wait in the outbox for the next login
+                self.app.end_session(SESSION_EXPIRED_MESSAGE)
+                return
+            error = result if isinstance(result, dict) else {'success': False, 'message': str(result)}
+            if status is None:
+                self._retry(result)  # keep them for when the server can be reached
+                return
+            if status >= 500:
+                for seq, _ in batch:
+                    self.attempts[seq] = self.attempts.get(seq, 0) + 1
+                seq, operation = batch[0]
+                if len(batch) > 1 or self.attempts[seq] < 2 * OUTBOX_MAX_ATTEMPTS:
+                    self._retry(result)  # keep them for when the server can take them
+                    return
+                message = f"Gave up on '{operation['op']}' after {self.attempts[seq]} server errors: {error.get('message')}"
+                results = [{'success': False, 'message': message}]
+                self.show_error(message)
+            else:
+                # the whole batch was rejected; every operation shares its error
+                results = [error] * len(batch)
+
+        self.retry_delay = OUTBOX_RETRY_MIN
+        for (seq, operation), op_result in zip(batch, results):
+            self.attempts.pop(seq, None)
+            self.app.cache.complete(user_id, seq, operation, op_result)
+            on_result = self.callbacks.pop(seq, None)
+            if on_result:
+                on_result(op_result)
+            elif not op_result.get('success'):
+                # queued in an earlier run; nothing else will report it
+                self.show_error(f"'{operation['op']}' failed: {op_result.get('message')}")
+        self.app.refresh_lists()
+        # a refused operation's local effect is undone by re-reading the server's rows
+        self.app.sync.outbox_applied(rejected=not all(op_result.get('success') for op_result in results))
+        if self.app.cache.pending(user_id, 1):
+            self.schedule(0)
+
+    def show_error(self, message):
+        print(message)
+        screen = self.app.root.current_screen if self.app.root else None
+        if hasattr(screen, 'update_status'):
+            screen.update_status(message, True)
+
+    def _retry(self, error):
+        self.in_flight = False
+        print(f"Batch request failed, retrying in {self.retry_delay}s: {error}")
+        self.schedule(self.retry_delay)
+        self.retry_delay = min(self.retry_delay * 2, OUTBOX_RETRY_MAX)
+
+
+# --- Background Sync ---
+class SyncManager:
+    """Keeps the local cache in step with the server.
+
+    A pass flushes the outbox, then asks /sync for the rows created, changed
+    or deleted since the token stored by the last pass and merges them into
+    the cache, so a refresh costs what changed rather than the size of the
+    lists. The first pass, or one whose token has outlived the server's
+    tombstones, gets `reset` and replaces the cached lists instead; a reset
+    comes in pages, fetched one after another until `next_cursor` is empty,
+    and the token is only stored after the last. Passes run on screen entry
+    and every SYNC_INTERVAL seconds.
+    """
+
+    TABLES = ('habits', 'messages')
+
+    def __init__(self, app, interval=SYNC_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.running = False
+        self.again = False  # run another pass when this one ends
+        self._event = None
+
+    def request(self):
+        """Start a pass, or queue one behind the pass in progress."""
+        if not self.app.user_id or not self.app.session_cookie:
+            return
+        if self._event is None:
+            self._event = Clock.schedule_interval(lambda dt: self.request(), self.interval)
+        if self.running:
+            self.again = True
+            return
+        self.running = True
+        self.app.operations.schedule(0)
+        self._fetch(self.app.user_id)
+
+    def stop(self):
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def outbox_applied(self, rejected=False):
+        """Operations reached the server: a pass already reading may have missed them."""
+        if self.running:
+            self.again = True
+        elif rejected:
+            self.request()
+
+    def _fetch(self, user_id, cursor=None):
+        url = f"{self.app.base_url}/sync"
+        since = self.app.cache.get_state(user_id, 'sync_since')
+        if cursor:
+            url += f"?cursor={cursor}"
+        elif since:
+            url += f"?since={since}"
+
+        def on_result(req, res):
+            self._apply(user_id, req, res, first_page=cursor is None)
+        try:
+            ApiRequest(url, req_headers=self.app.auth_headers(), on_success=on_result, on_failure=on_result,
+                       on_error=lambda req, error: self._finish(error), timeout=10)
+        except Exception as e:
+            self._finish(e)
+
+    def _apply(self, user_id, request, result, first_page=True):
+        if user_id != self.app.user_id:
+            return self._finish('user changed')
+        if request.resp_status == 401:
+            self._finish(result)
+            return self.app.end_session(SESSION_EXPIRED_MESSAGE)
+        if not isinstance(result, dict) or not result.get('success'):
+            return self._finish(result)
+        deleted = result.get('deleted', {})
+        for table in self.TABLES:
+            if result.get('reset') and first_page:
+                self.app.cache.replace(user_id, table, result.get(table, []))
+            else:
+                self.app.cache.merge(user_id, table, result.get(table, []), deleted.get(table, []))
+        self.app.refresh_lists()
+        if result.get('next_cursor'):
+            return self._fetch(user_id, result['next_cursor'])
+        # stored last: if the pass dies before this, the next one just re-reads the same changes
+        self.app.cache.set_state(user_id, 'sync_since', result['since'])
+        self._finish()
+
+    def _finish(self, error=None):
+        self.running = False
+        if error is not None:
+            print(f"Sync stopped: {error}")
+        if self.again:
+            self.again = False
+            self.request()
+
+
 # --- Main App Class (Line ~915 approx) ---
 class HabitApp(App):
     user_id = StringProperty('')
     base_url = StringProperty(BASE_URL)
     theme_colors = DictProperty(light_theme)
+    session_cookie = None  # signed session token from /login or /register
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.store = JsonStore('habitapp.json')
+        self.cache = None  # LocalCache, opened in build() once user_data_dir is known
+        self.operations = OperationQueue(self)
+        self.sync = SyncManager(self)
+        self.elapsed_ticker = ElapsedTimeTicker()
     
+    def auth_headers(self, content_type='application/json'):
+        """Request headers carrying the session token, if we have one."""
+        headers = {'Content-Type': content_type}
+        if self.session_cookie:
+            headers['Authorization'] = f'Bearer {self.session_cookie}'
+        return headers
+
+    def refresh_lists(self):
+        """Re-render the cached lists after the cache changed."""
+        if not self.root:
+            return
+        for name in ('dashboard', 'inbox'):
+            self.root.get_screen(name).show_cached()
+
     def build(self):
         # set window title
         self.title = 'Habit Free'
+        self.cache = LocalCache(os.path.join(self.user_data_dir, 'habit_free_cache.db'))
         
         # create screen manager
         sm = ScreenManager(transition=FadeTransition())
@@ -1349,15 +1536,40 @@ class HabitApp(App):
         sm.add_widget(MessageScreen(name='message'))
         return sm
     
+    def end_session(self, message=None):
+        """Forget the stored session and show the login screen, with `message` if given.
+
+        The cache and outbox stay for the next login.
+        """
+        if self.store.exists('session'):
+            self.store.delete('session')
+        self.sync.stop()
+        self.username = None
+        self.user_id = ''
+        self.session_cookie = None
+        if self.root:
+            self.root.current = 'login'
+            if message:
+                self.root.get_screen('login').update_status(message, True)
+
     def on_start(self):
-        # check if user is already logged in
-        store = JsonStore('habitapp.json')
-        if store.exists('user'):
-            user_data = store.get('user')
-            self.user_id = user_data.get('user_id', '')
+        # check if user is already logged in; the dashboard renders from the cache, even offline
+        if self.store.exists('session'):
+            session = self.store.get('session')
+            if not is_session_token(session.get('session_cookie')):
+                # saved before the server issued signed tokens (e.g. 'dummy_session'); it can't authenticate
+                self.end_session()
+                return
+            self.user_id = session.get('user_id', '')
+            self.username = session.get('username')
+            self.session_cookie = session.get('session_cookie')
             if self.user_id:
                 self.root.current = 'dashboard'
 
+    def on_stop(self):
+        if self.cache:
+            self.cache.close()
+
 # --- Run App (Line ~966 approx) ---
 if __name__ == '__main__':
     print("Starting HabitApp...")
@@ -0,0 +1,101 @@
+# habit_free/benchmarks/bench_compression.py
+#
+# Bytes on the wire and server CPU per request for /get_messages pages full of
+# 500-character messages, uncompressed and at several gzip/brotli levels.
+#
+#   python benchmarks/bench_compression.py --page-sizes 50 200 --requests 200
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('LOG_FILE', '')
+
+from app import create_app, db, brotli, compress_body, User, Message, issue_session_token  # noqa: E402
+
+WORDS = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(2000)]
+
+
+def message_text():
+    text = ' '.join(random.choices(WORDS, k=120))
+    return text[:500]
+
+
+def settings():
+    yield 'identity', None, None
+    for level in (1, 6, 9):
+        yield f'gzip {level}', 'gzip', level
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            yield f'br {quality}', 'br', quality
+
+
+def run(page_size, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+                          'COMPRESSION_MIN_SIZE': 0, 'PAGE_SIZE_MAX': page_size})
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User.__table__), [{'id': 1, 'username': 'bench', 'password': 'x'}])
+            db.session.execute(insert(Message.__table__), [
+                {'user_id': 1, 'message': message_text(), 'is_masked': bool(i % 2),
+                 'send_date': date(2025, 1, 1) + timedelta(days=i)} for i in range(page_size)
+            ])
+            db.session.commit()
+            token = issue_session_token(db.session.get(User, 1))
+
+        client = app.test_client()
+        url = f'/get_messages?limit={page_size}'
+        print(f'\n/get_messages, {page_size} messages per page, {requests} requests each')
+        print(f'  {"encoding":<10}{"bytes":>10}{"ratio":>8}{"compress ms":>13}{"request ms":>12}{"cpu ms":>10}')
+        raw = None
+        for label, encoding, level in settings():
+            config = {'COMPRESSION_ENABLED': encoding is not None}
+            if encoding == 'gzip':
+                config['COMPRESSION_GZIP_LEVEL'] = level
+            elif encoding == 'br':
+                config['COMPRESSION_BROTLI_QUALITY'] = level
+            app.config.update(config)
+            headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': encoding or 'identity'}
+
+            body = client.get(url, headers=headers).data
+            if raw is None:
+                raw = body
+            # compression alone, then whole requests (wall clock and process CPU)
+            started = time.perf_counter()
+            for _ in range(requests):
+                if encoding:
+                    compress_body(raw, encoding, level)
+            compress_ms = (time.perf_counter() - started) * 1000 / requests
+            started, cpu_started = time.perf_counter(), time.process_time()
+            for _ in range(requests):
+                client.get(url, headers=headers)
+            request_ms = (time.perf_counter() - started) * 1000 / requests
+            cpu_ms = (time.process_time() - cpu_started) * 1000 / requests
+            print(f'  {label:<10}{len(body):>10,}{len(raw) / len(body):>7.1f}x'
+                  f'{compress_ms:>13.3f}{request_ms:>12.3f}{cpu_ms:>10.3f}')
+        with app.app_context():
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response compression size and CPU cost')
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--requests', type=int, default=100)
+    args = parser.parse_args()
+    if brotli is None:
+        print('brotli is not installed; only gzip is measured')
+    for page_size in args.page_sizes:
+        run(page_size, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# habit_free/benchmarks/bench_indexes.py
+#
+# Lookup latency for the hot query paths with and without the model indexes.
+#
+#   python benchmarks/bench_indexes.py --sizes 10000 100000 1000000
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, insert, select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db, User, Habit, Message  # noqa: E402
+
+ROWS_PER_USER = 20
+INSERT_BATCH = 50000
+
+
+def populate(engine, rows):
+    """Insert `rows` habits and `rows` messages spread over rows/20 users."""
+    users = max(1, rows // ROWS_PER_USER)
+    start = date(2025, 1, 1)
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'username': f'user{i}', 'password': 'x' * 64} for i in range(1, users + 1)
+        ])
+        for offset in range(0, rows, INSERT_BATCH):
+            batch = range(offset, min(offset + INSERT_BATCH, rows))
+            conn.execute(insert(Habit.__table__), [
+                {'user_id': i % users + 1, 'name': f'habit {i}', 'start_datetime': now} for i in batch
+            ])
+            conn.execute(insert(Message.__table__), [
+                {'user_id': i % users + 1, 'message': f'message {i}', 'is_masked': True,
+                 'send_date': start + timedelta(days=i % 365)} for i in batch
+            ])
+    return users
+
+
+def time_lookups(engine, users, rows, samples):
+    """Return the median latency in milliseconds for each hot lookup."""
+    habit = Habit.__table__
+    message = Message.__table__
+    queries = {
+        'habits by user_id': lambda: select(habit).where(habit.c.user_id == random.randint(1, users)),
+        'message by user_id + id': lambda: select(message).where(
+            message.c.user_id == random.randint(1, users), message.c.id == random.randint(1, rows)),
+        'undelivered messages by send_date': lambda: select(message.c.id).where(
+            message.c.deleted_at.is_(None),
+            message.c.send_date == date(2025, 1, 1) + timedelta(days=random.randint(0, 364))),
+    }
+    results = {}
+    with engine.connect() as conn:
+        for name, build in queries.items():
+            timings = []
+            for _ in range(samples):
+                stmt = build()
+                started = time.perf_counter()
+                conn.execute(stmt).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+    return results
+
+
+def run(rows, samples):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        indexes = [index for table in (Habit.__table__, Message.__table__) for index in table.indexes]
+
+        db.metadata.create_all(engine)
+        for index in indexes:
+            index.drop(bind=engine)
+        users = populate(engine, rows)
+
+        before = time_lookups(engine, users, rows, samples)
+        for index in indexes:
+            index.create(bind=engine)
+        after = time_lookups(engine, users, rows, samples)
+        engine.dispose()
+
+    print(f'\n{rows:,} rows ({users:,} users), median of {samples} lookups')
+    print(f'  {"query":<34}{"no index (ms)":>15}{"indexed (ms)":>15}{"speedup":>10}')
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f'  {name:<34}{before[name]:>15.3f}{after[name]:>15.3f}{speedup:>9.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hot lookups with and without indexes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--samples', type=int, default=50)
+    args = parser.parse_args()
+    for rows in args.sizes:
+        run(rows, args.samples)
+
+
+if __name__ == '__main__':
+    main()
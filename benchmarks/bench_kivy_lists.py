@@ -0,0 +1,148 @@
+# habit_free/benchmarks/bench_kivy_lists.py
+#
+# Time to open the habits and inbox lists and the memory they hold at 10, 100
+# and 1000 rows: one widget per row in a ScrollView + GridLayout (how the lists
+# used to be built) against the RecycleView the client uses now. Needs Kivy and
+# a display (use xvfb-run on a headless box).
+#
+#   python benchmarks/bench_kivy_lists.py --sizes 10 100 1000 --repeat 3
+#
+# "open ms" runs from building the list until the first frames are drawn;
+# "memory" is the Python heap the open list holds, traced with tracemalloc.
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kivy.app import App  # noqa: E402
+from kivy.base import EventLoop  # noqa: E402
+from kivy.lang import Builder  # noqa: E402
+from kivy.metrics import dp  # noqa: E402
+from kivy.properties import DictProperty  # noqa: E402
+from kivy.uix.boxlayout import BoxLayout  # noqa: E402
+from kivy.uix.gridlayout import GridLayout  # noqa: E402
+from kivy.uix.recycleboxlayout import RecycleBoxLayout  # noqa: E402
+from kivy.uix.recycleview import RecycleView  # noqa: E402
+from kivy.uix.scrollview import ScrollView  # noqa: E402
+
+from app_kivy import (HabitItem, MessageItem, ElapsedTimeTicker, PREDEFINED_HABITS,  # noqa: E402
+                      light_theme, habit_view_data, message_view_data)
+
+KV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'habitapp.kv')
+FRAMES = 3  # frames to draw after building: layout and RecycleView refreshes run on the next clock tick
+
+
+class BenchApp(App):
+    """Just enough of HabitApp for the item rules and the elapsed-time ticker."""
+    theme_colors = DictProperty(light_theme)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.elapsed_ticker = ElapsedTimeTicker()
+
+
+def habits(count):
+    names = list(PREDEFINED_HABITS) + ['Custom habit']
+    now = datetime.now(timezone.utc)
+    return [{'id': i, 'name': names[i % len(names)],
+             'start_datetime': (now - timedelta(minutes=37 * i)).isoformat()} for i in range(1, count + 1)]
+
+
+def messages(count):
+    return [{'id': i, 'message': f'Message {i}: ' + 'keep going, one day at a time. ' * 6,
+             'send_date': f'2030-01-{i % 28 + 1:02d}', 'is_masked': i % 3 != 0} for i in range(1, count + 1)]
+
+
+def widget_list(viewclass, rows):
+    """The old way: a ScrollView around a GridLayout holding one item per row."""
+    grid = GridLayout(cols=1, spacing=dp(10), size_hint_y=None)
+    grid.bind(minimum_height=grid.setter('height'))
+    for row in rows:
+        item = viewclass()
+        item.refresh_view_attrs(None, 0, row)
+        grid.add_widget(item)
+    scroll = ScrollView()
+    scroll.add_widget(grid)
+    return scroll
+
+
+def recycle_list(viewclass, rows):
+    rv = RecycleView()
+    layout = RecycleBoxLayout(orientation='vertical', spacing=dp(10), default_size=(None, dp(100)),
+                              default_size_hint=(1, None), size_hint_y=None)
+    layout.bind(minimum_height=layout.setter('height'))
+    rv.add_widget(layout)
+    rv.viewclass = viewclass.__name__  # an alias for the layout manager's, so set after adding it
+    rv.data = rows
+    return rv
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.children)
+
+
+def open_once(host, build, viewclass, rows, trace=False):
+    """(seconds, traced bytes, widgets) to build one list and draw it. Tracing slows
+    the build down, so times and memory come from separate opens."""
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    widget = build(viewclass, rows)
+    host.add_widget(widget)
+    for _ in range(FRAMES):
+        EventLoop.idle()
+    elapsed = time.perf_counter() - started
+    held = 0
+    if trace:
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    widgets = count_widgets(widget)
+    host.remove_widget(widget)
+    EventLoop.idle()
+    return elapsed, held, widgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark opening the habit and message lists in Kivy')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3, help='timed opens per cell (the best is kept)')
+    args = parser.parse_args()
+
+    Builder.load_file(KV_FILE)
+    app = BenchApp()
+    App._running_app = app  # App.get_running_app() without blocking in App.run()
+    EventLoop.ensure_window()
+    host = BoxLayout()
+    EventLoop.window.add_widget(host)
+    EventLoop.idle()
+
+    lists = [('habits', HabitItem, habits, habit_view_data),
+             ('messages', MessageItem, messages, message_view_data)]
+    builds = [('widgets', widget_list), ('recycleview', recycle_list)]
+    print(f'window {EventLoop.window.width}x{EventLoop.window.height}, best of {args.repeat}')
+    print(f'  {"list":<10}{"rows":>6}  {"build":<12}{"open ms":>10}{"memory KiB":>12}{"widgets":>9}')
+    for name, viewclass, generate, view_data in lists:
+        for _, build in builds:  # warm up: compile the kv rules and load the textures once
+            open_once(host, build, viewclass, [view_data(item) for item in generate(10)])
+        for size in args.sizes:
+            rows = [view_data(item) for item in generate(size)]
+            for label, build in builds:
+                best = min(open_once(host, build, viewclass, rows)[0] for _ in range(args.repeat))
+                _, held, widgets = open_once(host, build, viewclass, rows, trace=True)
+                print(f'  {name:<10}{size:>6}  {label:<12}{best * 1000:>10.1f}{held / 1024:>12,.0f}{widgets:>9,}')
+
+    EventLoop.window.remove_widget(host)
+    EventLoop.close()
+
+
+if __name__ == '__main__':
+    main()
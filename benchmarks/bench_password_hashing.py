@@ -0,0 +1,77 @@
+# habit_free/benchmarks/bench_password_hashing.py
+#
+# Login throughput per core for each password hasher cost setting. A login is
+# one verify_password call on a cold cache, i.e. one full KDF evaluation.
+#
+#   python benchmarks/bench_password_hashing.py --seconds 3 --threads 1 4
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import ScryptHasher, PBKDF2Hasher, LegacySHA256Hasher  # noqa: E402
+
+SETTINGS = [
+    ('sha256 (legacy)', None),
+    ('scrypt n=2^12', ScryptHasher(n=2 ** 12)),
+    ('scrypt n=2^13', ScryptHasher(n=2 ** 13)),
+    ('scrypt n=2^14 (default)', ScryptHasher(n=2 ** 14)),
+    ('scrypt n=2^15', ScryptHasher(n=2 ** 15)),
+    ('scrypt n=2^16', ScryptHasher(n=2 ** 16)),
+    ('pbkdf2 100k', PBKDF2Hasher(iterations=100000)),
+    ('pbkdf2 300k', PBKDF2Hasher(iterations=300000)),
+    ('pbkdf2 600k (default)', PBKDF2Hasher(iterations=600000)),
+    ('pbkdf2 1M', PBKDF2Hasher(iterations=1000000)),
+]
+
+PASSWORD = 'correct horse'
+
+
+def logins_per_second(hasher, encoded, seconds, threads):
+    """Run verify() on `threads` threads for `seconds` and return the total rate."""
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            hasher.verify(PASSWORD, encoded)
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(lambda _: worker(), range(threads)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark login throughput per password hasher cost')
+    parser.add_argument('--seconds', type=float, default=2.0, help='measurement time per setting')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} CPUs; a login is one cold-cache verify')
+    header = f'{"setting":<26}{"ms/login":>10}' + ''.join(f'{f"{t} thr/s":>12}' for t in args.threads)
+    header += f'{"per core/s":>12}'
+    print(header)
+
+    for name, hasher in SETTINGS:
+        if hasher is None:
+            hasher = LegacySHA256Hasher()
+            encoded = hashlib.sha256(PASSWORD.encode()).hexdigest()
+        else:
+            encoded = hasher.encode(PASSWORD)
+
+        rates = [logins_per_second(hasher, encoded, args.seconds, threads) for threads in args.threads]
+        single = rates[0] / args.threads[0]
+        line = f'{name:<26}{1000 / single:>10.2f}' + ''.join(f'{rate:>12.1f}' for rate in rates)
+        print(line + f'{single:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# habit_free/benchmarks/bench_serialization.py
+#
+# Rows/sec for the list endpoints' read + serialize path: ORM objects and
+# to_dict() (the old path) against column tuples, each encoded by the stdlib
+# and the orjson JSON provider, plus end-to-end /get_habits pages.
+#
+#   python benchmarks/bench_serialization.py --rows 1000 10000 --seconds 2
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('LOG_FILE', '')
+
+from app import (create_app, db, orjson, OrjsonProvider, User, Habit, Message,  # noqa: E402
+                 HABIT_COLUMNS, MESSAGE_COLUMNS, habit_dict, message_dict, issue_session_token)
+
+
+def seed(rows):
+    now = datetime.now(timezone.utc)
+    start = date(2025, 1, 1)
+    db.session.execute(insert(User.__table__), [{'id': 1, 'username': 'bench', 'password': 'x'}])
+    db.session.execute(insert(Habit.__table__), [
+        {'user_id': 1, 'name': f'habit {i}', 'start_datetime': now} for i in range(rows)
+    ])
+    db.session.execute(insert(Message.__table__), [
+        {'user_id': 1, 'message': f'message {i}', 'is_masked': True,
+         'send_date': start + timedelta(days=i % 365)} for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def rate(work, rows, seconds):
+    """Run `work` repeatedly for `seconds`; return rows handled per second."""
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        work()
+        done += rows
+    return done / (time.perf_counter() - started)
+
+
+def run(rows, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+                          'SQL_PROFILER': False, 'PAGE_SIZE_MAX': rows})
+        providers = [('stdlib', DefaultJSONProvider(app))]
+        if orjson is not None:
+            providers.append(('orjson', OrjsonProvider(app)))
+
+        with app.app_context():
+            db.create_all()
+            seed(rows)
+
+            def orm(model, to_dict):
+                def work():
+                    db.session.expunge_all()
+                    return [to_dict(row) for row in model.query.filter_by(user_id=1).order_by(model.id).all()]
+                return work
+
+            def columns(model, cols, to_dict):
+                def work():
+                    return [to_dict(row) for row in
+                            db.session.query(*cols).filter(model.user_id == 1).order_by(model.id).all()]
+                return work
+
+            paths = [
+                ('habits  ORM + to_dict', orm(Habit, Habit.to_dict)),
+                ('habits  columns', columns(Habit, HABIT_COLUMNS, habit_dict)),
+                ('messages ORM + to_dict', orm(Message, Message.to_dict)),
+                ('messages columns', columns(Message, MESSAGE_COLUMNS, message_dict)),
+            ]
+            print(f'\n{rows:,} rows per listing, rows/sec')
+            print(f'  {"path":<26}' + ''.join(f'{name:>14}' for name, _ in providers))
+            for label, fetch in paths:
+                line = f'  {label:<26}'
+                for _, provider in providers:
+                    line += f'{rate(lambda: provider.dumps({"rows": fetch()}), rows, seconds):>14,.0f}'
+                print(line)
+
+            token = issue_session_token(db.session.get(User, 1))
+
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        line = f'  {"GET /get_habits (e2e)":<26}'
+        for _, provider in providers:
+            app.json = provider
+            line += f'{rate(lambda: client.get(f"/get_habits?limit={rows}", headers=headers), rows, seconds):>14,.0f}'
+        print(line)
+        with app.app_context():
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark list endpoint serialization throughput')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--seconds', type=float, default=1.0, help='measurement time per cell')
+    args = parser.parse_args()
+    if orjson is None:
+        print('orjson is not installed; only the stdlib provider is measured')
+    for rows in args.rows:
+        run(rows, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# habit_free/benchmarks/bench_sqlite_concurrency.py
+#
+# Read/write throughput of concurrent /get_habits-style readers and
+# /add-style writers on SQLite, with the stock rollback journal and with the
+# pragma profile from app.sqlite_pragmas() (WAL, synchronous=NORMAL, ...).
+#
+#   python benchmarks/bench_sqlite_concurrency.py --readers 8 --writers 2 --seconds 10
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db, User, Habit, apply_sqlite_pragmas, sqlite_pragmas  # noqa: E402
+
+USERS = 1000
+HABITS = 20000
+
+
+def make_engine(path, pragmas, threads):
+    engine = create_engine('sqlite:///' + path, pool_size=threads, max_overflow=0)
+    if pragmas:
+        apply_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'username': f'user{i}', 'password': 'x'} for i in range(1, USERS + 1)
+        ])
+        conn.execute(insert(Habit.__table__), [
+            {'user_id': i % USERS + 1, 'name': f'habit {i}', 'start_datetime': now} for i in range(HABITS)
+        ])
+
+
+def run(label, pragmas, readers, writers, seconds):
+    habit = Habit.__table__
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'bench.db'), pragmas, readers + writers)
+        seed(engine)
+        deadline = time.perf_counter() + seconds
+
+        def reader():
+            done = locked = 0
+            while time.perf_counter() < deadline:
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(select(habit).where(habit.c.user_id == random.randint(1, USERS))).fetchall()
+                    done += 1
+                except OperationalError:
+                    locked += 1
+            with lock:
+                counts['reads'] += done
+                counts['locked'] += locked
+
+        def writer():
+            done = locked = 0
+            while time.perf_counter() < deadline:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(habit).values(user_id=random.randint(1, USERS), name='new habit',
+                                                          start_datetime=datetime.now(timezone.utc)))
+                    done += 1
+                except OperationalError:
+                    locked += 1
+            with lock:
+                counts['writes'] += done
+                counts['locked'] += locked
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    print(f'{label:<34}{counts["reads"] / seconds:>12.0f}{counts["writes"] / seconds:>12.0f}{counts["locked"]:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent SQLite reads and writes before/after pragma tuning')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s each')
+    print(f'{"profile":<34}{"reads/s":>12}{"writes/s":>12}{"locked":>10}')
+    run('default (rollback journal)', [], args.readers, args.writers, args.seconds)
+    run('tuned (sqlite_pragmas())', sqlite_pragmas(), args.readers, args.writers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+# habit_free/benchmarks/regression.py
+#
+# Benchmark regression check for the API. Times the main routes and the
+# delivery job through the Flask test client on a temp-file SQLite database
+# at several data sizes, compares the best times with benchmarks/baselines.json,
+# and exits 1 if any case is slower than its baseline by more than --threshold.
+#
+#   python benchmarks/regression.py                  # compare against the baseline
+#   python benchmarks/regression.py --update         # record a new baseline
+#   python benchmarks/regression.py --sizes 100 --only get_habits add
+#
+# Timings are divided by a fixed pure-Python calibration loop measured in the
+# same run, so a baseline recorded on one machine stays usable on another.
+# Run-to-run noise on a shared machine reaches 20-30% for the fastest cases, so
+# --update times the suite --runs times and stores each case's median and its
+# spread (`noise`); a case fails only when it is slower than its baseline by
+# more than --threshold plus that spread, and still is after --rechecks re-timings.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')  # keep per-message delivery logs out of the timings
+
+from app import (create_app, init_app, db, check_and_send_messages, hash_password,  # noqa: E402
+                 issue_session_token, sync_token, utcnow, User, Habit, Message)
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+USERS_PER_SIZE = 10  # every user gets `size` habits and messages, so tables hold 10x size rows
+PASSWORD = 'benchpass'
+# password hashing dominates these; timed at the smallest size only
+SIZE_INDEPENDENT = ('register', 'login')
+
+
+def calibration_loop(_):
+    """A fixed CPU-bound workload; timings are expressed in multiples of it."""
+    total = 0
+    for i in range(200000):
+        total += i * i % 7
+    return total
+
+
+class Fixture:
+    """A fresh app and database with USERS_PER_SIZE users holding `size` habits and messages each."""
+
+    def __init__(self, tmp, size):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, f'bench{size}.db'),
+                               'SQL_PROFILER': False, 'COMPRESSION_ENABLED': False,
+                               # no re-read window, so a delta sync sees only what changed since its token
+                               'SYNC_OVERLAP_SECONDS': 0})
+        init_app(self.app)
+        self.client = self.app.test_client()
+        self.size = size
+        self.counter = 0
+        with self.app.app_context():
+            password = hash_password(PASSWORD)
+            now = datetime.now(timezone.utc)
+            future = date.today() + timedelta(days=30)
+            db.session.execute(insert(User.__table__), [
+                {'id': i, 'username': f'bench{i}', 'password': password, 'data_version': 0}
+                for i in range(1, USERS_PER_SIZE + 1)
+            ])
+            for user_id in range(1, USERS_PER_SIZE + 1):
+                db.session.execute(insert(Habit.__table__), [
+                    {'user_id': user_id, 'name': f'habit {i}', 'start_datetime': now} for i in range(size)
+                ])
+                db.session.execute(insert(Message.__table__), [
+                    {'user_id': user_id, 'message': f'message {i} ' * 10, 'is_masked': True,
+                     'send_date': future + timedelta(days=i % 300)} for i in range(size)
+                ])
+            db.session.commit()
+            self.headers = {'Authorization': f'Bearer {issue_session_token(db.session.get(User, 1))}'}
+
+    def unique_name(self):
+        self.counter += 1
+        return f'reg{self.size}x{self.counter}'
+
+    def insert_habits(self, count):
+        with self.app.app_context():
+            result = db.session.execute(insert(Habit.__table__).returning(Habit.id), [
+                {'user_id': 1, 'name': 'to delete', 'start_datetime': datetime.now(timezone.utc)}
+                for _ in range(count)
+            ])
+            ids = [row.id for row in result]
+            db.session.commit()
+            return ids
+
+    def insert_due_messages(self, count):
+        """`count` messages due yesterday. Earlier rounds' deliveries are purged,
+        as the tombstone purge would, so the table doesn't grow every round."""
+        with self.app.app_context():
+            db.session.execute(delete(Message).where(Message.deleted_at.isnot(None)))
+            db.session.execute(insert(Message.__table__), [
+                {'user_id': 1 + i % USERS_PER_SIZE, 'message': 'due', 'is_masked': True,
+                 'send_date': date.today() - timedelta(days=1)} for i in range(count)
+            ])
+            db.session.commit()
+
+    def deliver(self):
+        with self.app.app_context():
+            stats = check_and_send_messages()
+            assert stats and stats['delivered'] > 0, 'delivery job failed'
+
+
+def expect_ok(response):
+    assert response.status_code == 200, f'{response.status_code}: {response.get_data(as_text=True)[:200]}'
+
+
+def cases(fixture):
+    """(name, prepare, run): prepare() is untimed and returns run()'s argument."""
+    client, headers = fixture.client, fixture.headers
+    future = (date.today() + timedelta(days=10)).isoformat()
+    deletable = []
+
+    def next_habit_id():
+        if not deletable:
+            deletable.extend(fixture.insert_habits(50))
+        return deletable.pop()
+
+    return [
+        ('register', fixture.unique_name,
+         lambda name: expect_ok(client.post('/register', data={'username': name, 'password': PASSWORD}))),
+        ('login', lambda: None,
+         lambda _: expect_ok(client.post('/login', data={'username': 'bench1', 'password': PASSWORD}))),
+        ('get_habits', lambda: None, lambda _: expect_ok(client.get('/get_habits', headers=headers))),
+        ('add', lambda: None, lambda _: expect_ok(client.post('/add', data={'name': 'Caffeine'}, headers=headers))),
+        ('delete', next_habit_id, lambda habit_id: expect_ok(client.delete(f'/delete/{habit_id}', headers=headers))),
+        ('get_messages', lambda: None, lambda _: expect_ok(client.get('/get_messages', headers=headers))),
+        ('sync_full', lambda: None, lambda _: expect_ok(client.get('/sync', headers=headers))),
+        ('sync', lambda: sync_token(utcnow()),
+         lambda since: expect_ok(client.get(f'/sync?since={since}', headers=headers))),
+        ('inbox_get', lambda: None,
+         lambda _: expect_ok(client.get(f'/inbox?start={future}&end={future[:8]}28', headers=headers))),
+        ('inbox_post', lambda: None,
+         lambda _: expect_ok(client.post('/inbox', data={'message': 'hello', 'date': future}, headers=headers))),
+        ('check_and_send_messages', lambda: fixture.insert_due_messages(fixture.size), lambda _: fixture.deliver()),
+    ]
+
+
+def time_once(prepare, run):
+    arg = prepare()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        run(arg)
+        return time.perf_counter() - started
+    finally:
+        gc.enable()
+
+
+def measure(suite, repeat, warmup=2):
+    """Best time of each case over `repeat` rounds, like timeit: noise only ever adds
+    time, so the minimum is the stablest. Cases run round-robin so a burst of noise
+    on the machine hits every case, not a few of them back to back."""
+    best = {}
+    for round_number in range(warmup + repeat):
+        for name, prepare, run in suite:
+            elapsed = time_once(prepare, run)
+            if round_number >= warmup:
+                best[name] = min(best.get(name, elapsed), elapsed)
+    return best
+
+
+def run_suite(sizes, repeat, only, suspect=None, rechecks=0):
+    """Time every case at every size; return {'case@size': {'ms', 'units'}}.
+
+    suspect(key, units) flags results that look like regressions: once every
+    size has run, those cases are timed `repeat` more rounds, up to `rechecks`
+    times, keeping the best. Re-timing after the whole pass lets a slow spell
+    on the machine end first. Each size is calibrated in its own rounds.
+    """
+    calibration = ('calibration', lambda: None, calibration_loop)
+    timed = []  # (size, fixture, suite, best times)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            fixture = Fixture(tmp, size)
+            suite = [case for case in cases(fixture)
+                     if (not only or case[0] in only) and (size == min(sizes) or case[0] not in SIZE_INDEPENDENT)]
+            timed.append((size, fixture, suite, measure([calibration] + suite, repeat)))
+        for _ in range(rechecks if suspect else 0):
+            flagged = [(best, [case for case in suite
+                               if suspect(f'{case[0]}@{size}', best[case[0]] / best['calibration'])])
+                       for size, _, suite, best in timed]
+            if not any(slow for _, slow in flagged):
+                break
+            for best, slow in flagged:
+                if slow:
+                    again = measure([calibration] + slow, repeat, warmup=1)
+                    best.update({name: min(best[name], seconds) for name, seconds in again.items()})
+        results = {}
+        for size, fixture, _, best in timed:
+            unit = best.pop('calibration')
+            results.update({f'{name}@{size}': {'ms': round(seconds * 1000, 4), 'units': round(seconds / unit, 4)}
+                            for name, seconds in best.items()})
+            with fixture.app.app_context():
+                db.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time API routes and fail on regressions against a JSON baseline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='habits and messages per user')
+    parser.add_argument('--repeat', type=int, default=15, help='timed runs per case (the best is kept)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--rechecks', type=int, default=2,
+                        help='times a case over the threshold is re-timed before it counts as regressed')
+    parser.add_argument('--runs', type=int, default=3, help='suite runs recorded by --update')
+    parser.add_argument('--only', nargs='+', help='case names to run')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args()
+
+    if args.update:
+        runs = [run_suite(args.sizes, args.repeat, args.only) for _ in range(args.runs)]
+        results = {}
+        for key in runs[0]:
+            units = [run[key]['units'] for run in runs]
+            results[key] = {'ms': statistics.median(run[key]['ms'] for run in runs),
+                            'units': statistics.median(units),
+                            'noise': round(max(units) / min(units) - 1, 4)}
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get('results', {})
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                       'results': baseline}, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print(f'wrote {len(results)} results to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        raise SystemExit(f'no baseline at {args.baseline}; run with --update first')
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+
+    def allowed(key):
+        return args.threshold + baseline[key].get('noise', 0)
+
+    def suspect(key, units):
+        return key in baseline and units / baseline[key]['units'] - 1 > allowed(key)
+
+    results = run_suite(args.sizes, args.repeat, args.only, suspect, args.rechecks)
+
+    print(f'threshold +{args.threshold:.0%} plus each case\'s recorded noise, {args.rechecks} rechecks')
+    print(f'{"case":<32}{"baseline ms":>12}{"now ms":>10}{"change":>9}{"allowed":>9}  status')
+    regressions = 0
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            print(f'{key:<32}{"-":>12}{result["ms"]:>10.3f}{"":>9}  new (no baseline)')
+            continue
+        # compare in calibration units; show the baseline rescaled to this machine's speed
+        change = result['units'] / expected['units'] - 1
+        status = 'REGRESSED' if change > allowed(key) else 'ok'
+        regressions += status == 'REGRESSED'
+        print(f'{key:<32}{expected["units"] * result["ms"] / result["units"]:>12.3f}{result["ms"]:>10.3f}'
+              f'{change:>+9.1%}{allowed(key):>+9.0%}  {status}')
+
+    if regressions:
+        print(f'\n{regressions} case(s) regressed by more than their allowance')
+        sys.exit(1)
+    print('\nno regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# habit_free/client_cache.py
+#
+# Local SQLite store for the Kivy client. It holds the last known habits and
+# messages of each user, so lists render before the network answers, and a
+# durable outbox of mutations that survives restarts until the server has
+# applied them. Kept free of Kivy so it can be used and checked on its own.
+#
+# Mutations are applied to the cached rows when they are queued, so the UI
+# shows them at once. Rows created offline get negative local ids until the
+# server answers with real ones; queued operations on such a row wait until
+# then, and complete() rewrites them to the server id.
+
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS habits (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    start_datetime TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    send_date TEXT NOT NULL,
+    is_masked INTEGER NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    operation TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (user_id, key)
+);
+"""
+
+# operations that create a row, and the table the row lives in
+CREATES = {'add_habit': 'habits', 'save_message': 'messages'}
+
+
+class LocalCache:
+    """Cached habits and messages plus the outbox, in one SQLite file."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # rows, shaped like the API's; server rows in id order, then rows created offline
+    def habits(self, user_id):
+        rows = self.db.execute('SELECT id, name, start_datetime FROM habits WHERE user_id = ? '
+                               'ORDER BY id < 0, abs(id)', (user_id,))
+        return [dict(row) for row in rows]
+
+    def messages(self, user_id):
+        rows = self.db.execute('SELECT id, message, send_date, is_masked FROM messages WHERE user_id = ? '
+                               'ORDER BY id < 0, abs(id)', (user_id,))
+        return [dict(row, is_masked=bool(row['is_masked'])) for row in rows]
+
+    def _put_habit(self, user_id, habit):
+        self.db.execute('INSERT OR REPLACE INTO habits (user_id, id, name, start_datetime) VALUES (?, ?, ?, ?)',
+                        (user_id, habit['id'], habit['name'], habit['start_datetime']))
+
+    def _put_message(self, user_id, message):
+        self.db.execute('INSERT OR REPLACE INTO messages (user_id, id, message, send_date, is_masked) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (user_id, message['id'], message['message'], message['send_date'],
+                         int(message.get('is_masked', True))))
+
+    def replace(self, user_id, table, rows):
+        """Store a full server listing of `table`, then re-apply the outbox on top of it."""
+        put = self._put_habit if table == 'habits' else self._put_message
+        with self.db:
+            self.db.execute(f'DELETE FROM {table} WHERE user_id = ? AND id > 0', (user_id,))
+            for row in rows:
+                put(user_id, row)
+            for _, operation in self.pending(user_id):
+                self._apply(user_id, operation)
+
+    def merge(self, user_id, table, rows, deleted_ids):
+        """Apply a /sync delta to `table`: store changed rows, drop deleted ones, re-apply the outbox."""
+        put = self._put_habit if table == 'habits' else self._put_message
+        with self.db:
+            for row in rows:
+                put(user_id, row)
+            self.db.executemany(f'DELETE FROM {table} WHERE user_id = ? AND id = ?',
+                                [(user_id, row_id) for row_id in deleted_ids])
+            for _, operation in self.pending(user_id):
+                self._apply(user_id, operation)
+
+    def _apply(self, user_id, operation):
+        """The local effect of an operation on the cached rows."""
+        op, row_id = operation['op'], operation.get('id')
+        if op == 'add_habit':
+            self._put_habit(user_id, {'id': operation['local_id'], 'name': operation['name'],
+                                      'start_datetime': operation['start_datetime']})
+        elif op == 'save_message':
+            self._put_message(user_id, {'id': operation['local_id'], 'message': operation['message'],
+                                        'send_date': operation['date'], 'is_masked': True})
+        elif op == 'delete_habit':
+            self.db.execute('DELETE FROM habits WHERE user_id = ? AND id = ?', (user_id, row_id))
+        elif op == 'delete_message':
+            self.db.execute('DELETE FROM messages WHERE user_id = ? AND id = ?', (user_id, row_id))
+        elif op == 'toggle_message_mask':
+            self.db.execute('UPDATE messages SET is_masked = ? WHERE user_id = ? AND id = ?',
+                            (int(operation['is_masked']), user_id, row_id))
+
+    # the outbox
+    def enqueue(self, user_id, operation):
+        """Queue an operation and apply it locally; returns the operation as stored.
+
+        Creating operations get a negative local_id (and a start time for habits)
+        that stands in for the row's id until the server assigns one. Every
+        operation gets an op_id, so /batch applies it once however often it is sent.
+        """
+        operation = dict(operation, op_id=uuid.uuid4().hex)
+        with self.db:
+            if operation['op'] in CREATES:
+                # never reused, so a queued operation can't be mistaken for one on a newer row
+                operation['local_id'] = int(self.get_state(user_id, 'last_local_id', 0)) - 1
+                self._set_state(user_id, 'last_local_id', operation['local_id'])
+                if operation['op'] == 'add_habit':
+                    operation.setdefault('start_datetime', datetime.now(timezone.utc).isoformat())
+            cursor = self.db.execute('INSERT INTO outbox (user_id, operation) VALUES (?, ?)',
+                                     (user_id, json.dumps(operation)))
+            operation['seq'] = cursor.lastrowid
+            self._apply(user_id, operation)
+        return operation
+
+    def pending(self, user_id, limit=-1):
+        """[(seq, operation)] still to be sent, oldest first."""
+        rows = self.db.execute('SELECT seq, operation FROM outbox WHERE user_id = ? ORDER BY seq LIMIT ?',
+                               (user_id, limit))
+        return [(row['seq'], json.loads(row['operation'])) for row in rows]
+
+    def complete(self, user_id, seq, operation, result):
+        """Drop an operation the server has answered, adopting the row it created if any."""
+        table = CREATES.get(operation['op'])
+        with self.db:
+            self.db.execute('DELETE FROM outbox WHERE seq = ?', (seq,))
+            if not table:
+                return
+            self.db.execute(f'DELETE FROM {table} WHERE user_id = ? AND id = ?', (user_id, operation['local_id']))
+            created = (result.get('habit') or result.get('message_data')) if result.get('success') else None
+            if not created:
+                # the row was never created, so queued operations on it can't apply either
+                self.db.execute("DELETE FROM outbox WHERE user_id = ? AND json_extract(operation, '$.id') = ?",
+                                (user_id, operation['local_id']))
+                return
+            (self._put_habit if table == 'habits' else self._put_message)(user_id, created)
+            # queued operations on the row now target its server id, and apply to the adopted row
+            self.db.execute("UPDATE outbox SET operation = json_set(operation, '$.id', ?) "
+                            "WHERE user_id = ? AND json_extract(operation, '$.id') = ?",
+                            (created['id'], user_id, operation['local_id']))
+            for _, queued in self.pending(user_id):
+                if queued.get('id') == created['id']:
+                    self._apply(user_id, queued)
+
+    # sync bookkeeping
+    def get_state(self, user_id, key, default=None):
+        row = self.db.execute('SELECT value FROM sync_state WHERE user_id = ? AND key = ?',
+                              (user_id, key)).fetchone()
+        return row['value'] if row else default
+
+    def _set_state(self, user_id, key, value):
+        self.db.execute('INSERT OR REPLACE INTO sync_state (user_id, key, value) VALUES (?, ?, ?)',
+                        (user_id, key, value))
+
+    def set_state(self, user_id, key, value):
+        with self.db:
+            self._set_state(user_id, key, value)
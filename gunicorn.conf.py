@@ -0,0 +1,37 @@
+# habit_free/gunicorn.conf.py
+#
+# gunicorn settings for wsgi:app. Workers and threads come from the
+# environment so the same image fits small and large hosts.
+
+import os
+import secrets
+
+bind = os.getenv('BIND', '0.0.0.0:5002')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+accesslog = '-'
+
+# log to stderr unless LOG_FILE is set: every worker would otherwise open and
+# rotate the same file on its own. Set here so the master's environment, and
+# so every worker's, has it before anything calls create_app()
+os.environ.setdefault('LOG_FILE', '')
+
+
+def on_starting(server):
+    # workers sign and check session tokens with FLASK_SECRET_KEY; without one each
+    # would make up its own key and reject the others' tokens, so make one here
+    # and let every worker inherit it (tokens then only last until a restart)
+    if not os.getenv('FLASK_SECRET_KEY'):
+        os.environ['FLASK_SECRET_KEY'] = secrets.token_hex(32)
+        server.log.warning('FLASK_SECRET_KEY is not set; using a random key shared by this server\'s '
+                           'workers. Session tokens will not survive a restart.')
+
+    # create tables and run migrations once in the master, before any worker
+    # forks, so workers never race each other through ALTER TABLE
+    from app import create_app, db, init_app
+
+    app = create_app()
+    init_app(app)
+    with app.app_context():
+        db.engine.dispose()  # don't hand the master's connections to the workers
@@ -0,0 +1,332 @@
+# habit_free/scripts/loadtest.py
+#
+# Replays a weighted mix of API calls from concurrent virtual users and reports
+# p50/p95/p99 latency and throughput per route. Users log in as accounts made
+# by scripts/seed.py (<prefix><id> / --password), registering them if missing.
+#
+#   python app.py &                      # or gunicorn -c gunicorn.conf.py wsgi:app
+#   python scripts/loadtest.py --url http://127.0.0.1:5002 --users 50000 --concurrency 16 --seconds 60
+#   python scripts/loadtest.py --in-process --mix write-heavy       # Flask test client, no server
+#
+# --mix takes a preset name or explicit weights, e.g. get_habits=40,add=5,inbox_post=5
+
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MIXES = {
+    # mostly dashboard and inbox refreshes, as the Kivy client produces
+    'read-heavy': {'get_habits': 20, 'get_messages': 15, 'sync': 15, 'inbox_get': 15, 'add': 6, 'delete': 4,
+                   'inbox_post': 8, 'toggle_mask': 5, 'delete_message': 3, 'batch': 4, 'login': 2,
+                   'register': 1, 'home': 1, 'export': 0.5, 'import': 0.5},
+    'write-heavy': {'get_habits': 10, 'get_messages': 10, 'sync': 5, 'inbox_get': 5, 'add': 20, 'delete': 15,
+                    'inbox_post': 20, 'toggle_mask': 8, 'delete_message': 6, 'batch': 6, 'login': 2,
+                    'register': 2, 'home': 1, 'export': 0.5, 'import': 0.5},
+}
+
+
+class HttpTransport:
+    """Real HTTP against a running server, one keep-alive connection per virtual user."""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(url.netloc, timeout=30)
+        self.prefix = url.path.rstrip('/')
+
+    def call(self, method, path, headers=None, data=None, json_body=None, body=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            raw = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()  # reconnect on the next call
+            raise
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            payload = None
+        return response.status, payload
+
+
+class InProcessTransport:
+    """The Flask test client: no network or server process, same routes and database."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def call(self, method, path, headers=None, data=None, json_body=None, body=None):
+        response = self.client.open(path, method=method, headers=headers, data=body or data, json=json_body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class VirtualUser:
+    """One client session: logs in, remembers its habit/message ids and issues mix operations."""
+
+    def __init__(self, transport, username, password, rng):
+        self.transport = transport
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.headers = {}
+        self.habit_ids = []
+        self.message_ids = []
+        self.since = None
+        self.sync_cursor = None
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('headers', self.headers)
+        return self.transport.call(method, path, **kwargs)
+
+    def login(self):
+        status, body = self.request('POST', '/login', data={'username': self.username, 'password': self.password})
+        if status == 401:
+            status, body = self.request('POST', '/register',
+                                        data={'username': self.username, 'password': self.password})
+        if body and body.get('session_cookie'):
+            self.headers = {'Authorization': f"Bearer {body['session_cookie']}"}
+        return status
+
+    def future_date(self):
+        return (date.today() + timedelta(days=self.rng.randint(1, 365))).isoformat()
+
+    # operations: each returns the HTTP status
+    def op_home(self):
+        return self.request('GET', '/')[0]
+
+    def op_register(self):
+        name = f'lt{self.rng.randrange(10 ** 12)}'
+        return self.request('POST', '/register', data={'username': name, 'password': 'loadtest'}, headers={})[0]
+
+    def op_login(self):
+        return self.login()
+
+    def op_get_habits(self):
+        status, body = self.request('GET', '/get_habits')
+        if body and body.get('habits'):
+            self.habit_ids = [habit['id'] for habit in body['habits']]
+        return status
+
+    def op_get_messages(self):
+        status, body = self.request('GET', '/get_messages')
+        if body and body.get('messages'):
+            self.message_ids = [message['id'] for message in body['messages']]
+        return status
+
+    def op_sync(self):
+        if self.sync_cursor:
+            path = f'/sync?cursor={self.sync_cursor}'  # the next page of a reset
+        else:
+            path = f'/sync?since={self.since}' if self.since else '/sync'
+        status, body = self.request('GET', path)
+        if body and body.get('success'):
+            self.sync_cursor = body.get('next_cursor')
+            if not self.sync_cursor:
+                self.since = body['since']
+        return status
+
+    def op_inbox_get(self):
+        start = date.today() + timedelta(days=self.rng.randint(0, 300))
+        return self.request('GET', f'/inbox?start={start.isoformat()}&end={(start + timedelta(days=7)).isoformat()}')[0]
+
+    def op_add(self):
+        status, body = self.request('POST', '/add', data={'name': self.rng.choice(['Smoking', 'Caffeine', 'Alcohol'])})
+        if body and body.get('habit'):
+            self.habit_ids.append(body['habit']['id'])
+        return status
+
+    def op_delete(self):
+        if not self.habit_ids:
+            return self.op_add()
+        return self.request('DELETE', f'/delete/{self.habit_ids.pop()}')[0]
+
+    def op_inbox_post(self):
+        status, body = self.request('POST', '/inbox', data={'message': 'load test message ' * self.rng.randint(1, 25),
+                                                            'date': self.future_date()})
+        if body and body.get('message_data'):
+            self.message_ids.append(body['message_data']['id'])
+        return status
+
+    def op_toggle_mask(self):
+        if not self.message_ids:
+            return self.op_inbox_post()
+        return self.request('POST', f'/toggle_message_mask/{self.rng.choice(self.message_ids)}')[0]
+
+    def op_delete_message(self):
+        if not self.message_ids:
+            return self.op_inbox_post()
+        return self.request('DELETE', f'/delete_message/{self.message_ids.pop()}')[0]
+
+    def op_batch(self):
+        operations = [{'op': 'add_habit', 'name': 'Junk Food'},
+                      {'op': 'save_message', 'message': 'batched', 'date': self.future_date()}]
+        if self.message_ids:
+            operations.append({'op': 'toggle_message_mask', 'id': self.rng.choice(self.message_ids)})
+        return self.request('POST', '/batch', json_body={'operations': operations})[0]
+
+    def op_export(self):
+        return self.request('GET', '/export')[0]
+
+    def op_import(self):
+        lines = [json.dumps({'type': 'habit', 'name': 'Imported'}),
+                 json.dumps({'type': 'message', 'message': 'imported', 'send_date': self.future_date()})]
+        return self.request('POST', '/import', body='\n'.join(lines) + '\n',
+                            headers={**self.headers, 'Content-Type': 'application/x-ndjson'})[0]
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return MIXES[value]
+    try:
+        mix = {name: float(weight) for name, weight in (item.split('=') for item in value.split(','))}
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid mix {value!r}')
+    unknown = [name for name in mix if not hasattr(VirtualUser, f'op_{name}')]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown operations: {', '.join(unknown)}")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(args, make_transport):
+    names, weights = zip(*args.mix.items())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    state = {}
+    # everyone logs in first; the clock starts once the last virtual user is ready
+    start_barrier = threading.Barrier(args.concurrency + 1,
+                                      action=lambda: state.update(deadline=time.perf_counter() + args.seconds))
+
+    def worker(index):
+        rng = random.Random(args.seed + index if args.seed is not None else None)
+        try:
+            user = VirtualUser(make_transport(), f'{args.prefix}{rng.randint(args.first_user, args.users)}',
+                               args.password, rng)
+            user.login()
+            user.op_get_habits()
+            user.op_get_messages()
+        except Exception:
+            start_barrier.abort()  # don't leave the others waiting for us
+            raise
+        local_latencies, local_errors = defaultdict(list), defaultdict(int)
+        try:
+            start_barrier.wait()
+        except threading.BrokenBarrierError:
+            return
+        while time.perf_counter() < state['deadline']:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(user, f'op_{name}')()
+            except Exception:
+                status = None
+            local_latencies[name].append(time.perf_counter() - started)
+            # 404 on a row another virtual user already deleted and 409 on a taken name are expected
+            if status is None or (status >= 400 and status not in (404, 409)):
+                local_errors[name] += 1
+        with lock:
+            for name, values in local_latencies.items():
+                latencies[name].extend(values)
+            for name, count in local_errors.items():
+                errors[name] += count
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        raise SystemExit('a virtual user failed to start; is the server running?')
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def report(latencies, errors, elapsed, as_json):
+    rows = []
+    everything = sorted(value for values in latencies.values() for value in values)
+    for name in sorted(latencies, key=lambda key: -len(latencies[key])) + ['TOTAL']:
+        values = everything if name == 'TOTAL' else sorted(latencies[name])
+        rows.append({
+            'route': name, 'requests': len(values),
+            'errors': sum(errors.values()) if name == 'TOTAL' else errors[name],
+            'rps': len(values) / elapsed,
+            'mean_ms': statistics.fmean(values) * 1000 if values else 0.0,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        })
+    if as_json:
+        print(json.dumps({'seconds': elapsed, 'routes': rows}, indent=1))
+        return
+    print(f'{"operation":<16}{"requests":>10}{"errors":>8}{"req/s":>10}{"mean ms":>10}'
+          f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for row in rows:
+        print(f"{row['route']:<16}{row['requests']:>10,}{row['errors']:>8}{row['rps']:>10.1f}{row['mean_ms']:>10.2f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a traffic mix against the API and report latency')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://127.0.0.1:5002', help='server to load (default %(default)s)')
+    target.add_argument('--in-process', action='store_true',
+                        help='drive app.py through the Flask test client against DATABASE_URL instead')
+    parser.add_argument('--mix', type=parse_mix, default='read-heavy',
+                        help=f"preset ({', '.join(MIXES)}) or name=weight,... (default read-heavy)")
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--users', type=int, default=1000, help='pick users <prefix>1..<prefix>N')
+    parser.add_argument('--first-user', type=int, default=1)
+    parser.add_argument('--prefix', default='seed')
+    parser.add_argument('--password', default='seedpass')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    if args.in_process:
+        sys.path.insert(0, ROOT)
+        os.environ.setdefault('LOG_FILE', '')
+        from app import create_app, init_app
+        app = create_app()
+        init_app(app)
+        make_transport = lambda: InProcessTransport(app)  # noqa: E731
+        target = f"in-process ({app.config['SQLALCHEMY_DATABASE_URI']})"
+    else:
+        make_transport = lambda: HttpTransport(args.url)  # noqa: E731
+        target = args.url
+
+    if not args.json:
+        print(f'{target}: {args.concurrency} virtual users for {args.seconds:g}s')
+    latencies, errors, elapsed = run(args, make_transport)
+    report(latencies, errors, elapsed, args.json)
+
+
+if __name__ == '__main__':
+    main()
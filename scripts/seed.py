@@ -0,0 +1,155 @@
+# habit_free/scripts/seed.py
+#
+# Fills the configured database (DATABASE_URL, or habits.db) with synthetic
+# users, habits and messages using bulk inserts, for testing at production
+# scale. Per-user counts and send dates follow configurable distributions:
+#
+#   fixed:N            always N
+#   uniform:LO:HI      integer uniformly in [LO, HI]
+#   normal:MEAN:SD     rounded normal, clipped at 0 for counts
+#   poisson:MEAN       Poisson
+#   zipf:S             heavy tail (S > 1; smaller is heavier): most users have few
+#                      rows, a few very many. zipf:2.2 averages about 4
+#
+#   python scripts/seed.py --users 100000 --habits zipf:2.2 --messages poisson:8 \
+#       --send-dates uniform:-3:365
+#
+# Every seeded user is named <prefix><id> and has the password given by
+# --password, so scripts/loadtest.py can log in as them.
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('LOG_FILE', '')
+
+from app import create_app, init_app, db, hash_password, User, Habit, Message  # noqa: E402
+
+WORDS = ('walk read water sleep breathe call friend journal stretch cook plan sunrise proud '
+         'remember patience steady today tomorrow week month promise kind strong calm small step').split()
+
+
+def distribution(spec):
+    """Parse a distribution spec into a function of a random.Random returning an int."""
+    kind, _, params = spec.partition(':')
+    try:
+        args = [float(value) for value in params.split(':')] if params else []
+        if kind == 'fixed' and len(args) == 1:
+            return lambda rng: int(args[0])
+        if kind == 'uniform' and len(args) == 2:
+            return lambda rng: rng.randint(int(args[0]), int(args[1]))
+        if kind == 'normal' and len(args) == 2:
+            return lambda rng: round(rng.gauss(args[0], args[1]))
+        if kind == 'poisson' and len(args) == 1:
+            return lambda rng: poisson(rng, args[0])
+        if kind == 'zipf' and len(args) == 1 and args[0] > 1:
+            return lambda rng: int(rng.paretovariate(args[0] - 1)) - 1
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f'invalid distribution {spec!r}')
+
+
+def poisson(rng, mean):
+    if mean > 30:  # normal approximation; Knuth's method gets slow
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    habits_per_user, messages_per_user, send_offset = args.habits, args.messages, args.send_dates
+    today = date.today()
+    now = datetime.now(timezone.utc)
+
+    password = hash_password(args.password)  # one KDF run shared by every seeded user
+    first_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    totals = {'users': 0, 'habits': 0, 'messages': 0}
+    started = time.perf_counter()
+
+    for batch_start in range(first_id, first_id + args.users, args.batch_size):
+        batch_ids = range(batch_start, min(batch_start + args.batch_size, first_id + args.users))
+        users, habits, messages = [], [], []
+        for user_id in batch_ids:
+            users.append({'id': user_id, 'username': f'{args.prefix}{user_id}', 'password': password,
+                          'data_version': 0})
+            for _ in range(min(max(habits_per_user(rng), 0), args.max_per_user)):
+                habits.append({'user_id': user_id, 'name': rng.choice(args.habit_names),
+                               'start_datetime': now - timedelta(seconds=rng.randint(0, 365 * 86400))})
+            for _ in range(min(max(messages_per_user(rng), 0), args.max_per_user)):
+                messages.append({'user_id': user_id, 'message': sentence(rng, rng.randint(3, 60))[:500],
+                                 'send_date': today + timedelta(days=send_offset(rng)),
+                                 'is_masked': rng.random() < 0.8})
+
+        db.session.execute(insert(User.__table__), users)
+        for table, rows in ((Habit.__table__, habits), (Message.__table__, messages)):
+            for offset in range(0, len(rows), args.batch_size):
+                db.session.execute(insert(table), rows[offset:offset + args.batch_size])
+        db.session.commit()
+
+        totals['users'] += len(users)
+        totals['habits'] += len(habits)
+        totals['messages'] += len(messages)
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        print(f"{totals['users']:>10,} users {totals['habits']:>12,} habits {totals['messages']:>12,} messages"
+              f"  {rows / elapsed:>10,.0f} rows/s", flush=True)
+
+    if db.engine.dialect.name == 'postgresql' and totals['users']:
+        # explicit ids don't advance the serial sequence; without this the next
+        # /register would be handed an id a seeded user already has
+        table = db.engine.dialect.identifier_preparer.format_table(User.__table__)
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT max(id) FROM {table}))"),
+                           {'table': table})
+        db.session.commit()
+
+    return first_id, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-insert synthetic users, habits and messages')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--habits', type=distribution, default='poisson:4', help='habits per user')
+    parser.add_argument('--messages', type=distribution, default='poisson:6', help='messages per user')
+    parser.add_argument('--send-dates', type=distribution, default='uniform:-7:365',
+                        help='message send date, in days from today (negative is overdue)')
+    parser.add_argument('--max-per-user', type=int, default=10000, help='cap on habits or messages per user')
+    parser.add_argument('--batch-size', type=int, default=5000, help='users (and rows) per insert')
+    parser.add_argument('--prefix', default='seed', help='username prefix; usernames are <prefix><id>')
+    parser.add_argument('--password', default='seedpass', help='password of every seeded user')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, for reproducible data')
+    parser.add_argument('--reset', action='store_true', help='drop all tables first (destroys data!)')
+    args = parser.parse_args()
+    args.habit_names = ['Smoking', 'Excessive Sugar', 'Nail Biting', 'Procrastination',
+                        'Excessive Screen Time', 'Alcohol', 'Caffeine', 'Junk Food']
+    if len(f'{args.prefix}{args.users * 10}') > 15:
+        parser.error('prefix too long: usernames are limited to 15 characters')
+
+    app = create_app()
+    if args.reset:
+        with app.app_context():
+            db.drop_all()
+    init_app(app)
+    with app.app_context():
+        print(f"seeding {app.config['SQLALCHEMY_DATABASE_URI']}")
+        first_id, totals = seed(args)
+    print(f"done: users {args.prefix}{first_id}..{args.prefix}{first_id + totals['users'] - 1}, "
+          f"password {args.password!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+# habit_free/wsgi.py
+#
+# Production entry point:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker joins the scheduler leader election; only the winner runs the
+# midnight delivery job (see app.start_scheduler).
+
+import os
+
+# production servers run several processes; each would rotate a shared log
+# file on its own, so log to stderr unless LOG_FILE is set explicitly
+os.environ.setdefault('LOG_FILE', '')
+
+from app import create_app, start_scheduler  # noqa: E402
+
+app = create_app()
+start_scheduler(app)